@@ -0,0 +1,68 @@
+"""
+Compares the two-parse catalogue extraction with the single-parse getIDs.parse_catalogue on a saved copy of the
+Perseus collection page.
+
+Usage, from the repository root:
+    python -m benchmarks.benchCatalogue <saved collection page .html> [repeats]
+"""
+
+import sys
+import time
+
+import getIDs
+
+
+def two_parses(html):
+    return getIDs.get_perseus_work_info_trResults(html) + getIDs.get_perseus_work_info_trHiddenResults(html)
+
+
+def best_time(function, repeats):
+    """
+    Returns the result of `function` and the best wall time in seconds over `repeats` calls.
+    """
+
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def benchmark(html, repeats=3):
+    """
+    Times every extraction variant on `html`.
+
+    Returns:
+        A list of dicts with the variant name, the number of works found, the best time in seconds and whether the
+        works match those of the two-parse extraction.
+    """
+
+    variants = [('two parses, html.parser', lambda: two_parses(html)),
+                ('one parse, html.parser', lambda: getIDs.parse_catalogue(html, 'html.parser'))]
+    if getIDs.get_html_parser() != 'html.parser':
+        variants.append((f'one parse, {getIDs.get_html_parser()}', lambda: getIDs.parse_catalogue(html)))
+
+    measurements = []
+    reference = None
+    for name, function in variants:
+        works, seconds = best_time(function, repeats)
+        if reference is None:
+            reference = works
+        measurements.append({'variant': name, 'works': len(works), 'seconds': seconds, 'same': works == reference})
+    return measurements
+
+
+def main():
+    with open(sys.argv[1], 'r', encoding='utf-8') as file:
+        html = file.read()
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    print(f'{"variant":<26}{"works":>8}{"seconds":>10}{"same result":>13}')
+    for result in benchmark(html, repeats):
+        print(f'{result["variant"]:<26}{result["works"]:>8}{result["seconds"]:>10.3f}{str(result["same"]):>13}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Compares the disk footprint and the read + parse time of the vocabulary lists stored as plain XML, gzip and zstd.
+
+Usage, from the repository root:
+    python -m benchmarks.benchCompressedXml [directory with vocabulary list XML files]
+
+Without a directory, a synthetic corpus is generated (see benchmarks.syntheticCorpus). zstd is measured only when
+the zstandard package is installed. Every variant parses every file with xmlToCsv.iter_frequency_rows, the reader
+of the conversion stage, so the times include the decompression the conversion pays.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import xmlStorage
+import xmlToCsv
+from benchmarks import syntheticCorpus
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, file))
+               for root, dirs, files in os.walk(directory) for file in files)
+
+
+def parse_all(directory):
+    # Parse every stored list, keeping only the number of rows
+    rows = 0
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if xmlStorage.is_xml_file(file):
+                rows += sum(1 for _ in xmlToCsv.iter_frequency_rows(os.path.join(root, file)))
+    return rows
+
+
+def benchmark(source, repeats=3):
+    """
+    Stores a copy of the XML files below `source` with every compression available and parses it `repeats` times.
+
+    Returns:
+        A list of dicts with the variant, its size in bytes, the rows parsed and the best time in seconds.
+    """
+
+    variants = [None, 'gzip'] + (['zstd'] if xmlStorage.get_compression() == 'zstd' else [])
+    measurements = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for compression in variants:
+            directory = os.path.join(temp_dir, compression or 'plain')
+            shutil.copytree(source, directory, ignore=shutil.ignore_patterns('*.csv'))
+            if compression:
+                sys.stdout, stdout = open(os.devnull, 'w'), sys.stdout
+                try:
+                    xmlStorage.compress_xml_files(directory, compression)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+
+            seconds = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                rows = parse_all(directory)
+                seconds.append(time.perf_counter() - start)
+
+            measurements.append({'variant': compression or 'plain', 'bytes': directory_size(directory),
+                                 'rows': rows, 'seconds': min(seconds)})
+
+    return measurements
+
+
+def main():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if len(sys.argv) > 1:
+            source = sys.argv[1]
+        else:
+            source = temp_dir
+            syntheticCorpus.generate_corpus(source, authors=10, works_per_author=5, lemmas_per_work=2000)
+
+        results = benchmark(source)
+
+    plain = results[0]
+    print(f'{"variant":<10}{"MB":>10}{"ratio":>8}{"rows":>10}{"seconds":>10}{"vs plain":>10}')
+    for result in results:
+        ratio = plain['bytes'] / result['bytes'] if result['bytes'] else 0.0
+        relative = result['seconds'] / plain['seconds'] if plain['seconds'] else 0.0
+        print(f'{result["variant"]:<10}{result["bytes"] / 1024 ** 2:>10.2f}{ratio:>8.1f}{result["rows"]:>10}'
+              f'{result["seconds"]:>10.2f}{relative:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
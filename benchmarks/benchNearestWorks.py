@@ -0,0 +1,103 @@
+"""
+Compares the approximate nearest-work search of similarity.RandomProjectionIndex with the exact cosine search.
+
+Usage, from the repository root:
+    python -m benchmarks.benchNearestWorks [works ...]
+
+For every number of works (1000, 5000 and 20000 by default) a synthetic lemma x work matrix is generated, in which
+works are drawn from a few dozen "genres" sharing a Zipf vocabulary, so that every work has true neighbours. The
+report gives the index build time, the mean time of a top-20 query, exact and approximate, and the recall of the
+approximate search: the share of the exact 20 nearest works that it finds, and the mean similarity of the
+works it returns relative to that of the exact 20.
+"""
+
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+import similarity
+
+K = 20
+QUERIES = 200
+
+
+def synthetic_matrix(n_works, n_lemmas=50000, tokens_per_work=5000, works_per_genre=20, genre_share=0.5, seed=0):
+    """
+    Returns a sparse n_lemmas x n_works count matrix. Every work draws `tokens_per_work` tokens, partly from the Zipf
+    vocabulary shared by all works and partly from the Zipf vocabulary of its genre, so that like real texts all works
+    share their frequent lemmas and the works of a genre are each other's nearest neighbours.
+    """
+
+    rng = np.random.default_rng(seed)
+    zipf = 1.0 / np.arange(1, n_lemmas + 1) ** 1.1
+    zipf /= zipf.sum()
+    genres = max(1, n_works // works_per_genre)
+    # Cumulative distribution of every genre, sampled by bisection
+    genre_cdfs = [np.cumsum((1 - genre_share) * zipf + genre_share * zipf[rng.permutation(n_lemmas)])
+                  for _ in range(genres)]
+
+    rows, columns, values = [], [], []
+    for work in range(n_works):
+        cdf = genre_cdfs[rng.integers(genres)]
+        tokens = np.minimum(np.searchsorted(cdf, rng.random(tokens_per_work) * cdf[-1]), n_lemmas - 1)
+        lemmas, counts = np.unique(tokens, return_counts=True)
+        rows.append(lemmas)
+        columns.append(np.full(len(lemmas), work))
+        values.append(counts)
+
+    return sparse.csc_matrix((np.concatenate(values).astype(np.float64),
+                              (np.concatenate(rows), np.concatenate(columns))), shape=(n_lemmas, n_works))
+
+
+def benchmark(n_works, queries=QUERIES, k=K, **index_options):
+    """
+    Returns a dict with the build time, the mean exact and approximate query times, the mean recall at k and the
+    mean similarity of the approximate neighbours relative to that of the exact ones.
+    """
+
+    matrix = synthetic_matrix(n_works)
+    normalized = similarity.normalize_columns(matrix)
+    query_columns = np.random.default_rng(1).choice(n_works, size=min(queries, n_works), replace=False)
+
+    start = time.perf_counter()
+    index = similarity.RandomProjectionIndex(matrix, **index_options)
+    build_seconds = time.perf_counter() - start
+
+    exact, approximate = [], []
+    start = time.perf_counter()
+    for column in query_columns:
+        # Exact search over the normalized columns, as top_k_similar does once they are normalized
+        scores = np.asarray((normalized.T @ normalized[:, [column]]).toarray()).ravel()
+        scores[column] = -np.inf
+        best = np.argpartition(-scores, k - 1)[:k]
+        exact.append(dict(zip(best.tolist(), scores[best].tolist())))
+    exact_seconds = (time.perf_counter() - start) / len(query_columns)
+
+    start = time.perf_counter()
+    for column in query_columns:
+        approximate.append(dict(index.query(column, k)))
+    approximate_seconds = (time.perf_counter() - start) / len(query_columns)
+
+    recall = np.mean([len(found.keys() & true.keys()) / k for found, true in zip(approximate, exact)])
+    quality = np.mean([sum(found.values()) / sum(true.values()) for found, true in zip(approximate, exact)])
+    return {'works': n_works, 'build_seconds': build_seconds, 'exact_ms': exact_seconds * 1000,
+            'approximate_ms': approximate_seconds * 1000, 'recall': float(recall), 'similarity': float(quality)}
+
+
+def main():
+    sizes = [int(argument) for argument in sys.argv[1:]] or [1000, 5000, 20000]
+
+    print(f'{"works":>8}{"build s":>10}{"exact ms":>10}{"ANN ms":>10}{"speed-up":>10}{"recall@" + str(K):>11}'
+          f'{"similarity":>12}')
+    for n_works in sizes:
+        result = benchmark(n_works)
+        speed_up = result['exact_ms'] / result['approximate_ms'] if result['approximate_ms'] else 0.0
+        print(f'{result["works"]:>8}{result["build_seconds"]:>10.2f}{result["exact_ms"]:>10.2f}'
+              f'{result["approximate_ms"]:>10.2f}{speed_up:>10.1f}{result["recall"]:>11.3f}'
+              f'{result["similarity"]:>12.4f}')
+
+
+if __name__ == '__main__':
+    main()
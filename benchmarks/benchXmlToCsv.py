@@ -0,0 +1,97 @@
+"""
+Compares the tree-based XML to CSV conversion with the streaming one, sequential and in parallel.
+
+Usage, from the repository root:
+    python -m benchmarks.benchXmlToCsv <directory with vocabulary list XML files> [workers]
+
+Every variant converts a fresh copy of the directory in its own process, so the peak RSS reported for a
+variant is not inflated by the ones that ran before it.
+"""
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import instrumentation
+import xmlToCsv
+
+
+def convert_tree(directory):
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.xml'):
+                xml_file = os.path.join(root, file)
+                xmlToCsv.convert_xml_to_csv(xml_file, os.path.splitext(xml_file)[0] + '.csv')
+
+
+def convert_stream(directory):
+    xmlToCsv.convert_directory_xml_to_csv(directory, workers=1)
+
+
+def count_rows(directory):
+    rows = 0
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.csv'):
+                with open(os.path.join(root, file), encoding='utf-8') as csv_file:
+                    rows += sum(1 for _ in csv_file) - 1
+    return rows
+
+
+def run_variant(name, source, workers, results):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        directory = os.path.join(temp_dir, 'xml')
+        shutil.copytree(source, directory)
+
+        # Silence the per file messages, including those printed by the worker processes
+        sys.stdout.flush()
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+        start = time.perf_counter()
+        if name == 'tree':
+            convert_tree(directory)
+        elif name == 'stream':
+            convert_stream(directory)
+        else:
+            xmlToCsv.convert_directory_xml_to_csv(directory, workers=workers)
+        seconds = time.perf_counter() - start
+
+        results.put({'variant': name, 'rows': count_rows(directory), 'seconds': seconds,
+                     'peak_rss_mb': instrumentation.peak_rss_mb()})
+
+
+def benchmark(source, workers=None):
+    """
+    Runs the 'tree', 'stream' and 'parallel' variants on the XML files below `source`.
+
+    Returns:
+        A list of dicts with the variant name, rows converted, seconds and peak RSS in MB.
+    """
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    measurements = []
+    for name in ('tree', 'stream', 'parallel'):
+        process = context.Process(target=run_variant, args=(name, source, workers, results))
+        process.start()
+        measurements.append(results.get())
+        process.join()
+    return measurements
+
+
+def main():
+    source = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    print(f'{"variant":<10}{"rows":>10}{"seconds":>10}{"rows/s":>12}{"peak RSS MB":>14}')
+    for result in benchmark(source, workers):
+        rate = result['rows'] / result['seconds'] if result['seconds'] else 0.0
+        rss = f'{result["peak_rss_mb"]:.1f}' if result['peak_rss_mb'] is not None else 'n/a'
+        print(f'{result["variant"]:<10}{result["rows"]:>10}{result["seconds"]:>10.2f}{rate:>12.0f}{rss:>14}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Checks xmlDownloader.fetch_text_frequencies against a local stand-in for the Perseus vocablist service.
+
+Usage, from the repository root:
+    python -m benchmarks.checkDownloader
+
+The stand-in server answers on 127.0.0.1 with canned responses chosen by the work id: a vocabulary list, an HTML
+error page, a truncated document, a 500 that lasts and a 500 that clears on the next attempt. The check downloads
+every work, then lets the server recover and retries the failed works from their failed works file. It then runs
+the download stage of main.run_all twice through a stage manifest, to check that a work that failed is fetched by
+the next run. Every expectation that was not met is reported, and the script then exits with status 1.
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import main as pipeline
+import stageCache
+import xmlDownloader
+import xmlStorage
+
+VOCABULARY_LIST = (b'<?xml version="1.0" encoding="UTF-8"?>\n<vocabulary>\n'
+                   b'<frequency><lemma><headword>lo/gos</headword><shortDefinition>word</shortDefinition></lemma>'
+                   b'<maxFrequency>3</maxFrequency><minFrequency>1</minFrequency>'
+                   b'<weightedFrequency>3</weightedFrequency><keyTermScore>0.0030</keyTermScore></frequency>\n'
+                   b'</vocabulary>\n')
+
+ERROR_PAGE = b'<html><body><h1>Service temporarily unavailable</h1></body></html>'
+
+# Work id -> behaviour of the server until it recovers, and whether the download is expected to fail then
+WORKS = {
+    'ok-1': ('xml', False),
+    'ok-2': ('xml', False),
+    'flaky': ('500 once', False),
+    'error-page': ('html', True),
+    'truncated': ('truncated', True),
+    'down': ('500', True),
+}
+
+
+class StandInService:
+    """
+    Local HTTP server answering vocablist requests with the canned response of every work id, see WORKS.
+
+    Once `recovered` is set, every work gets its vocabulary list.
+    """
+
+    def __init__(self):
+        self.recovered = False
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}/hopper/vocablist'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                work = parse_qs(urlsplit(self.path).query).get('works', [''])[0]
+                with service.lock:
+                    service.requests[work] = service.requests.get(work, 0) + 1
+                    attempt = service.requests[work]
+                behaviour = 'xml' if service.recovered else WORKS.get(work, ('xml', False))[0]
+
+                if behaviour == '500' or (behaviour == '500 once' and attempt == 1):
+                    self.reply(500, 'text/html', ERROR_PAGE)
+                elif behaviour == 'html':
+                    self.reply(200, 'text/html', ERROR_PAGE)
+                elif behaviour == 'truncated':
+                    self.reply(200, 'text/xml', VOCABULARY_LIST[:len(VOCABULARY_LIST) // 2])
+                else:
+                    self.reply(200, 'text/xml', VOCABULARY_LIST)
+
+            def reply(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def write_work_info(csv_file):
+    os.makedirs(os.path.dirname(csv_file), exist_ok=True)
+    with open(csv_file, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Language', 'Author', 'Title', 'Work ID'])
+        for work in WORKS:
+            writer.writerow(['Greek', 'Author', f'Title {work}', work])
+
+
+def stored_works(folder):
+    directory = os.path.join(folder, 'greek', 'Author')
+    return {work for work in WORKS
+            if xmlStorage.find_stored(os.path.join(directory, f'Author - Title {work} - Pure freq.xml'))}
+
+
+def leftover_files(folder):
+    # Partial downloads must never be left behind
+    return [file for root, dirs, files in os.walk(folder) for file in files if file.endswith('.part')]
+
+
+def failed_works(failed_file):
+    if not os.path.isfile(failed_file):
+        return set()
+    with open(failed_file, newline='', encoding='utf-8') as file:
+        return {row[3] for row in list(csv.reader(file))[1:]}
+
+
+def check_downloader(folder, service):
+    """
+    Runs the download, retry and rerun scenario against `service` in `folder`.
+
+    Returns:
+        The list of the expectations that were not met, empty when the downloader behaved.
+    """
+
+    problems = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    work_info_file = os.path.join(folder, 'work_info_gr.csv')
+    failed_file = os.path.join(folder, 'failed works greek.csv')
+    write_work_info(work_info_file)
+    options = {'workers': 3, 'requests_per_second': None, 'retries': 1, 'timeout': 10, 'base_url': service.url}
+    expected_failures = {work for work, (_, fails) in WORKS.items() if fails}
+
+    # First run: the valid lists are saved, the 500 that clears is retried, the rest is listed as failed
+    result = xmlDownloader.fetch_text_frequencies(work_info_file, 'greek', folder, **options)
+    expect(result['saved'] == len(WORKS) - len(expected_failures), f'first run saved {result["saved"]} works')
+    expect(result['failed'] == len(expected_failures), f'first run failed {result["failed"]} works')
+    expect(stored_works(folder) == set(WORKS) - expected_failures, f'stored after first run: {stored_works(folder)}')
+    expect(failed_works(failed_file) == expected_failures, f'failed works file lists {failed_works(failed_file)}')
+    expect(service.requests.get('flaky') == 2, f'flaky work requested {service.requests.get("flaky")} times')
+    expect(not leftover_files(folder), f'partial files left: {leftover_files(folder)}')
+
+    # Retry of the failed works only, once the server has recovered
+    service.recovered = True
+    result = xmlDownloader.fetch_text_frequencies(failed_file, 'greek', folder, **options)
+    expect(result['saved'] == len(expected_failures) and result['skipped'] == 0,
+           f'retry saved {result["saved"]} and skipped {result["skipped"]} works')
+    expect(stored_works(folder) == set(WORKS), f'stored after retry: {stored_works(folder)}')
+    expect(not os.path.isfile(failed_file), 'failed works file left after a complete retry')
+
+    # A rerun of the whole list downloads nothing again
+    requests_before = sum(service.requests.values())
+    result = xmlDownloader.fetch_text_frequencies(work_info_file, 'greek', folder, **options)
+    expect(result['skipped'] == len(WORKS) and result['saved'] == 0, f'rerun saved {result["saved"]} works')
+    expect(sum(service.requests.values()) == requests_before, 'rerun sent requests for stored works')
+
+    return problems
+
+
+def check_download_stage(folder, service):
+    """
+    Runs the download stage of main.run_all twice against `service` in `folder`, the server recovering in between.
+
+    Returns:
+        The list of the expectations that were not met.
+    """
+
+    problems = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    work_info_file = os.path.join(folder, 'work_info_gr.csv')
+    write_work_info(work_info_file)
+    manifest = stageCache.StageManifest(os.path.join(folder, 'stage manifest.json'))
+    options = {'workers': 3, 'requests_per_second': None, 'retries': 1, 'timeout': 10, 'base_url': service.url}
+    expected_failures = {work for work, (_, fails) in WORKS.items() if fails}
+
+    def run_stage():
+        return manifest.run('download greek', **pipeline.download_stage(work_info_file, 'greek', folder, **options))
+
+    service.recovered = False
+    run_stage()
+    expect(stored_works(folder) == set(WORKS) - expected_failures, f'stored after first run: {stored_works(folder)}')
+
+    # The failed works are fetched by the next run, although the work info file did not change
+    service.recovered = True
+    expect(run_stage(), 'second run skipped the stage with works missing')
+    expect(stored_works(folder) == set(WORKS), f'stored after second run: {stored_works(folder)}')
+
+    # Once nothing is missing, the stage is up to date
+    expect(not run_stage(), 'third run did not skip the complete stage')
+
+    return problems
+
+
+def main():
+    with tempfile.TemporaryDirectory() as folder, StandInService() as service:
+        problems = check_downloader(os.path.join(folder, 'downloader'), service)
+        problems += check_download_stage(os.path.join(folder, 'stage'), service)
+
+    for problem in problems:
+        print(f'FAILED: {problem}')
+    print('Downloader check passed.' if not problems else f'{len(problems)} expectations not met.')
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Times the main pipeline stages on synthetic corpora of several sizes and keeps a history of the results.
+
+Usage, from the repository root:
+    python -m benchmarks.runBenchmarks [scale ...] [--history <file>] [--threshold <ratio>]
+
+Scales are the names in SCALES (all of them by default). Every run is appended to the history file, and each stage
+is compared with its previous measurement at the same scale: stages that got slower than `threshold` times the
+previous time are reported as regressions, and the script then exits with status 1.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import csvAnalysis
+import instrumentation
+import removeUselessData
+import xmlToCsv
+from benchmarks import syntheticCorpus
+
+# authors, works per author, lemmas per work
+SCALES = {
+    'small': (5, 4, 500),
+    'medium': (20, 5, 2000),
+    'large': (50, 8, 5000),
+}
+
+WORDS_FILE = 'gr - wordsToEliminate.csv'
+
+
+def run_scale(scale, directory):
+    """
+    Generates the corpus of `scale` in `directory` and runs the stages on it one after the other.
+
+    Returns:
+        The list of stage measurements of an instrumentation.PipelineReport.
+    """
+
+    authors, works_per_author, lemmas_per_work = SCALES[scale]
+    syntheticCorpus.generate_corpus(directory, authors, works_per_author, lemmas_per_work,
+                                    stopwords_file=WORDS_FILE)
+
+    corpus_directory = os.path.join(directory, 'greek')
+    author_directory = os.path.join(directory, 'By Author')
+    frequency_file = os.path.join(directory, '- all freq.csv')
+    no_dict_file = os.path.join(directory, '- all freq no dict.csv')
+    percent_file = os.path.join(directory, '- all perc.csv')
+
+    report = instrumentation.PipelineReport()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        with report.stage('conversion') as counters:
+            counters.update(xmlToCsv.convert_directory_xml_to_csv(corpus_directory, workers=1))
+
+        with report.stage('eliminate_words') as counters:
+            counters.update(removeUselessData.eliminate_words(corpus_directory, WORDS_FILE))
+
+        with report.stage('merge_all_by_author'):
+            csvAnalysis.merge_all_by_author(corpus_directory, author_directory)
+
+        with report.stage('merge_csv_files') as counters:
+            matrix = csvAnalysis.merge_csv_files(corpus_directory, frequency_file)
+            counters.update(lemmas=matrix.shape[0], works=matrix.shape[1])
+
+        csvAnalysis.add_progressive_numbering(frequency_file, os.path.join(directory, '- dictionary.csv'),
+                                              no_dict_file)
+
+        with report.stage('calculate_percentages'):
+            csvAnalysis.calculate_percentages(no_dict_file, percent_file)
+
+        with report.stage('calculate_similarity_matrix'):
+            csvAnalysis.calculate_similarity_matrix(percent_file, os.path.join(directory, '- similarity matrix.csv'))
+
+    return report.stages
+
+
+def previous_results(history_file):
+    """
+    Returns the last recorded measurement of every (scale, stage) pair in `history_file`.
+    """
+
+    previous = {}
+    if os.path.isfile(history_file):
+        with open(history_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                run = json.loads(line)
+                for scale, stages in run['scales'].items():
+                    for stage in stages:
+                        previous[(scale, stage['stage'])] = stage
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on synthetic corpora.')
+    # Checked below rather than with choices, which argparse also applies to an empty list of scales
+    parser.add_argument('scales', nargs='*', help=f'Scales to run, among {", ".join(SCALES)}; all by default.')
+    parser.add_argument('--history', default='benchmark history.jsonl')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    arguments = parser.parse_args()
+    unknown = [scale for scale in arguments.scales if scale not in SCALES]
+    if unknown:
+        parser.error(f'unknown scales: {", ".join(unknown)}')
+
+    previous = previous_results(arguments.history)
+    run = {'started': datetime.datetime.now().isoformat(timespec='seconds'), 'scales': {}}
+    regressions = []
+
+    print(f'{"scale":<8}{"stage":<30}{"seconds":>10}{"previous":>10}{"peak RSS MB":>14}')
+    for scale in arguments.scales or list(SCALES):
+        directory = tempfile.mkdtemp(prefix=f'benchmark {scale} ')
+        try:
+            stages = run_scale(scale, directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        run['scales'][scale] = stages
+
+        for stage in stages:
+            before = previous.get((scale, stage['stage']))
+            before_seconds = before['wall_seconds'] if before else None
+            if before_seconds and stage['wall_seconds'] > arguments.threshold * before_seconds:
+                regressions.append((scale, stage['stage'], before_seconds, stage['wall_seconds']))
+
+            rss = f'{stage["peak_rss_mb"]:.1f}' if stage['peak_rss_mb'] is not None else 'n/a'
+            before_text = f'{before_seconds:.3f}' if before_seconds is not None else '-'
+            print(f'{scale:<8}{stage["stage"]:<30}{stage["wall_seconds"]:>10.3f}{before_text:>10}{rss:>14}')
+
+    with open(arguments.history, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(run) + '\n')
+
+    for scale, stage, before_seconds, seconds in regressions:
+        print(f'Regression: {stage} at scale {scale} took {seconds:.3f} s, previously {before_seconds:.3f} s.')
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
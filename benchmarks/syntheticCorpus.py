@@ -0,0 +1,135 @@
+"""
+Generates synthetic Perseus vocabulary lists, so that the pipeline stages can be measured without scraping the site.
+
+Usage, from the repository root:
+    python -m benchmarks.syntheticCorpus <output directory> [authors] [works per author] [lemmas per work]
+
+The files follow the layout written by xmlDownloader.fetch_text_frequencies
+(<directory>/greek/<author>/<author> - <title> - Pure freq.xml) and the schema read by xmlToCsv.convert_xml_to_csv.
+"""
+
+import csv
+import os
+import sys
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+CONSONANTS = ['b', 'g', 'd', 'z', 'q', 'k', 'l', 'm', 'n', 'c', 'p', 'r', 's', 't', 'f', 'x', 'y']
+VOWELS = ['a', 'e', 'h', 'i', 'o', 'u', 'w']
+ACCENTS = ['/', '\\', '=']
+
+
+def beta_code_headwords(count, rng):
+    """
+    Returns `count` distinct Beta code headwords, with breathings, accents and the occasional iota subscript.
+    """
+
+    headwords = []
+    seen = set()
+    while len(headwords) < count:
+        syllables = [rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.integers(1, 5))]
+        if rng.random() < 0.3:
+            # Initial vowel with a breathing
+            syllables.insert(0, rng.choice(VOWELS) + rng.choice([')', '(']))
+        accented = rng.integers(len(syllables))
+        syllables[accented] += rng.choice(ACCENTS)
+        if syllables[-1][-2:-1] in ('a', 'h', 'w') and rng.random() < 0.1:
+            syllables[-1] += '|'
+
+        headword = ''.join(syllables)
+        if headword not in seen:
+            seen.add(headword)
+            headwords.append(headword)
+    return headwords
+
+
+def load_stopwords(words_file):
+    with open(words_file, 'r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        next(reader)  # Skip the header row
+        return [row[0] for row in reader]
+
+
+def write_vocabulary_list(xml_file, entries):
+    """
+    Writes (headword, short definition, weighted frequency) entries as a vocabulary list XML file.
+    """
+
+    with open(xml_file, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<vocabulary>\n')
+        for headword, short_definition, frequency in entries:
+            file.write(f'<frequency><lemma><headword>{escape(headword)}</headword>'
+                       f'<shortDefinition>{escape(short_definition)}</shortDefinition></lemma>'
+                       f'<maxFrequency>{frequency}</maxFrequency><minFrequency>{max(1, frequency // 2)}</minFrequency>'
+                       f'<weightedFrequency>{frequency}</weightedFrequency>'
+                       f'<keyTermScore>{frequency / 1000:.4f}</keyTermScore></frequency>\n')
+        file.write('</vocabulary>\n')
+
+
+def generate_corpus(directory, authors=5, works_per_author=4, lemmas_per_work=2000, vocabulary_size=None,
+                    zipf_exponent=1.1, lang='greek', stopwords_file='gr - wordsToEliminate.csv', seed=0):
+    """
+    Generates a synthetic corpus of vocabulary lists.
+
+    Args:
+        directory: Root directory, in the role of the "classicalTextFrequencies" folder.
+        authors: Number of authors.
+        works_per_author: Number of works of every author.
+        lemmas_per_work: Number of lemmas listed in every work.
+        vocabulary_size: Number of distinct lemmas in the corpus, 5 x lemmas_per_work by default.
+        zipf_exponent: Exponent of the Zipf law that both the popularity of the lemmas across works and the
+                       frequencies within a work follow.
+        lang: Language folder.
+        stopwords_file: When it exists, its words are used as the most common lemmas, so that eliminate_words has
+                        real work to do.
+        seed: Seed of the random generator; the same arguments always produce the same corpus.
+
+    Returns:
+        The list of XML files written.
+    """
+
+    rng = np.random.default_rng(seed)
+    vocabulary_size = vocabulary_size or lemmas_per_work * 5
+
+    stopwords = load_stopwords(stopwords_file) if stopwords_file and os.path.isfile(stopwords_file) else []
+    stopwords = list(dict.fromkeys(stopwords))[:vocabulary_size]
+    generated = beta_code_headwords(vocabulary_size + len(stopwords), rng)
+    stopword_set = set(stopwords)
+    headwords = (stopwords + [word for word in generated if word not in stopword_set])[:vocabulary_size]
+
+    # Popularity of every lemma across the corpus, following Zipf's law
+    popularity = 1.0 / np.arange(1, vocabulary_size + 1) ** zipf_exponent
+    popularity /= popularity.sum()
+
+    xml_files = []
+    for author_index in range(authors):
+        author = f'Author {author_index:03d}'
+        author_directory = os.path.join(directory, lang, author)
+        os.makedirs(author_directory, exist_ok=True)
+
+        for work_index in range(works_per_author):
+            count = min(lemmas_per_work, vocabulary_size)
+            lemmas = rng.choice(vocabulary_size, size=count, replace=False, p=popularity)
+            # Frequencies within the work follow Zipf's law too, the most popular lemmas being the most frequent
+            lemmas.sort()
+            frequencies = np.maximum(1, (10000 / np.arange(1, count + 1) ** zipf_exponent).astype(int))
+
+            entries = [(headwords[lemma], f'definition of {headwords[lemma]}', int(frequency))
+                       for lemma, frequency in zip(lemmas, frequencies)]
+            xml_file = os.path.join(author_directory, f'{author} - Work {work_index:03d} - Pure freq.xml')
+            write_vocabulary_list(xml_file, entries)
+            xml_files.append(xml_file)
+
+    return xml_files
+
+
+def main():
+    directory = sys.argv[1]
+    sizes = [int(argument) for argument in sys.argv[2:5]]
+    xml_files = generate_corpus(directory, *sizes)
+    print(f'{len(xml_files)} vocabulary lists written to {directory}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+import bisect
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import csvAnalysis
+import frequencyMatrix
+import weighting
+
+# Binary copy of "- all freq.csv" kept next to it when the dataset has no frequencyMatrix.MATRIX_DIRECTORY, see
+# load_corpus
+CORPUS_CACHE = "- corpus cache"
+
+
+class Corpus:
+    """
+    In-process index over a merged frequency table, answering lemma and work queries without reading the CSV files.
+
+    The counts are held twice: by work (compressed sparse columns), so that the vector of a work is a slice, and by
+    lemma (compressed sparse rows), which is the inverted index lemma -> (work, count). The counts of every author
+    are summed once as well. Headwords are kept sorted for prefix search with bisect, and every query touches only
+    the entries it returns.
+
+    Usage:
+        corpus = load_corpus("greek output/All Works - pure")
+        corpus.works_using("lo/gos", n=10)
+        corpus.top_lemmas_by_author("Homer", n=20)
+
+    Attributes:
+        lemmas: DataFrame with the "headword" and "shortDefinition" of each row, in row order.
+        works: List with the label of each work, in column order.
+        counts: scipy.sparse.csc_matrix of the lemma x work counts.
+        by_lemma: The same counts as a scipy.sparse.csr_matrix, the inverted index.
+        scale: 100 / total count of every work, which turns a count into its percentage as in "- all perc.csv".
+        authors: Dict mapping every author to the columns of their works.
+    """
+
+    def __init__(self, matrix, authors=None):
+        """
+        Args:
+            matrix: frequencyMatrix.FrequencyMatrix of the dataset.
+            authors: Optional dict mapping every work label to its author, e.g. csvAnalysis.author_groups. The author
+                     of a work missing from it is read from the label, see csvAnalysis.work_author.
+        """
+
+        self.lemmas = matrix.lemmas
+        self.headwords = self.lemmas["headword"].tolist()
+        self.short_definitions = self.lemmas["shortDefinition"].tolist()
+        self.works = list(matrix.works)
+        self.counts = sparse.csc_matrix(matrix.counts, dtype=np.float64)
+        self.by_lemma = self.counts.tocsr()
+        self.scale = weighting.column_scale(np.asarray(self.counts.sum(axis=0)).ravel())
+        self.work_columns = {work: i for i, work in enumerate(self.works)}
+
+        self.authors = {}
+        for i, work in enumerate(self.works):
+            author = (authors or {}).get(work) or csvAnalysis.work_author(work)
+            self.authors.setdefault(author, []).append(i)
+
+        # Sum the columns of every author once, with one product by the work -> author indicator matrix. This is
+        # done here rather than on the first query, so that the index is never seen half built by another thread
+        groups = {self.works[column]: author for author, columns in self.authors.items() for column in columns}
+        author_labels, indicator = frequencyMatrix.group_indicator(self.works, groups)
+        self.author_counts = sparse.csc_matrix(self.counts @ indicator)
+        self.author_scale = weighting.column_scale(np.asarray(self.author_counts.sum(axis=0)).ravel())
+        self.author_columns = {author: i for i, author in enumerate(author_labels)}
+
+        self.headword_rows = {}
+        for row, headword in enumerate(self.headwords):
+            self.headword_rows.setdefault(headword, []).append(row)
+
+        # Sorted headwords for prefix search, with the row of each
+        headwords = np.asarray([str(headword) for headword in self.headwords], dtype=object)
+        self.sorted_rows = np.argsort(headwords, kind="stable")
+        self.sorted_headwords = headwords[self.sorted_rows].tolist()
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def lemma(self, row):
+        return self.headwords[row], self.short_definitions[row]
+
+    def lookup(self, headword, short_definition=None):
+        """
+        Returns the rows of the lemmas with `headword`, restricted to `short_definition` when it is given.
+        """
+
+        rows = self.headword_rows.get(headword, [])
+        if short_definition is not None:
+            rows = [row for row in rows if self.short_definitions[row] == short_definition]
+        return rows
+
+    def lemma_frequencies(self, headword, short_definition=None):
+        """
+        Returns the works that use the lemma, as a dict mapping every work to its (count, percentage).
+
+        The counts of the lemmas sharing the headword are summed when no short definition is given.
+        """
+
+        frequencies = {}
+        for row in self.lookup(headword, short_definition):
+            start, stop = self.by_lemma.indptr[row], self.by_lemma.indptr[row + 1]
+            columns = self.by_lemma.indices[start:stop]
+            counts = self.by_lemma.data[start:stop]
+            for column, count, percentage in zip(columns.tolist(), counts.tolist(),
+                                                 (counts * self.scale[columns]).tolist()):
+                previous = frequencies.get(self.works[column], (0.0, 0.0))
+                frequencies[self.works[column]] = (previous[0] + count, previous[1] + percentage)
+        return frequencies
+
+    def works_using(self, headword, short_definition=None, n=10, by="percentage"):
+        """
+        Returns the `n` works that use the lemma most, as (work, count, percentage) tuples.
+
+        Args:
+            by: "percentage" ranks the works by the share of the lemma in them, "count" by its raw frequency.
+        """
+
+        frequencies = self.lemma_frequencies(headword, short_definition)
+        key = 1 if by == "count" else 2
+        ranked = sorted(((work, count, percentage) for work, (count, percentage) in frequencies.items()),
+                        key=lambda entry: entry[key], reverse=True)
+        return ranked[:n]
+
+    def top_lemmas(self, work, n=20, weighted=False):
+        """
+        Returns the `n` most frequent lemmas of `work`, as (headword, shortDefinition, value) tuples.
+
+        Args:
+            weighted: Rank by percentage instead of raw count.
+        """
+
+        column = self.work_columns[work]
+        start, stop = self.counts.indptr[column], self.counts.indptr[column + 1]
+        values = self.counts.data[start:stop] * (self.scale[column] if weighted else 1.0)
+        return self.best_rows(self.counts.indices[start:stop], values, n)
+
+    def top_lemmas_by_author(self, author, n=20, weighted=False):
+        """
+        Returns the `n` most frequent lemmas of all the works of `author`, as (headword, shortDefinition, value)
+        tuples. With weighted=True the value is the percentage of the lemma in the author's works taken together.
+        """
+
+        column = self.author_columns[author]
+        start, stop = self.author_counts.indptr[column], self.author_counts.indptr[column + 1]
+        values = self.author_counts.data[start:stop] * (self.author_scale[column] if weighted else 1.0)
+        return self.best_rows(self.author_counts.indices[start:stop], values, n)
+
+    def best_rows(self, rows, values, n):
+        # Select the n best in linear time, then sort only those
+        n = min(n, len(values))
+        if n <= 0:
+            return []
+        best = np.argpartition(-values, n - 1)[:n]
+        best = best[np.argsort(-values[best], kind="stable")]
+        return [self.lemma(row) + (float(value),) for row, value in zip(rows[best].tolist(), values[best].tolist())]
+
+    def work_vector(self, work, weighted=False):
+        """
+        Returns the lemma frequencies of `work` as a Series indexed by (headword, shortDefinition), without zeros.
+        """
+
+        column = self.work_columns[work]
+        start, stop = self.counts.indptr[column], self.counts.indptr[column + 1]
+        rows = self.counts.indices[start:stop]
+        values = self.counts.data[start:stop] * (self.scale[column] if weighted else 1.0)
+        index = pd.MultiIndex.from_frame(self.lemmas.iloc[rows], names=frequencyMatrix.LEMMA_COLUMNS)
+        return pd.Series(values, index=index, name=work)
+
+    def prefix_search(self, prefix, limit=50):
+        """
+        Returns the (headword, shortDefinition) of the lemmas whose headword starts with `prefix`, in headword
+        order, at most `limit` of them.
+        """
+
+        start = bisect.bisect_left(self.sorted_headwords, prefix)
+        results = []
+        for position in range(start, min(start + limit, len(self.sorted_headwords))):
+            if not self.sorted_headwords[position].startswith(prefix):
+                break
+            results.append(self.lemma(int(self.sorted_rows[position])))
+        return results
+
+
+def load_corpus(directory, authors=None):
+    """
+    Loads the Corpus of a dataset directory written by main.create_Dataset.
+
+    The binary "- all freq matrix" written by the merge is memory-mapped when the directory has one, together with
+    the authors saved with it. Otherwise "- all freq.csv" is read once and saved as a binary matrix in CORPUS_CACHE,
+    which later loads reuse for as long as the CSV file keeps its size and modification time.
+
+    Args:
+        directory: Dataset directory, e.g. "greek output/All Works - pure".
+        authors: Optional dict mapping work labels to their author, see Corpus. It is added to the authors saved
+                 with the matrix, and takes precedence over them.
+    """
+
+    matrix_directory = os.path.join(directory, frequencyMatrix.MATRIX_DIRECTORY)
+    if frequencyMatrix.is_frequency_matrix(matrix_directory):
+        matrix, metadata = frequencyMatrix.load_frequency_matrix(matrix_directory, mmap_mode="r")
+        return Corpus(matrix, {**metadata.get("authors", {}), **(authors or {})})
+
+    csv_file = os.path.join(directory, "- all freq.csv")
+    stat = os.stat(csv_file)
+    source = {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    cache_directory = os.path.join(directory, CORPUS_CACHE)
+    if frequencyMatrix.is_frequency_matrix(cache_directory):
+        matrix, metadata = frequencyMatrix.load_frequency_matrix(cache_directory, mmap_mode="r")
+        if metadata.get("source") == source:
+            return Corpus(matrix, authors)
+
+    data = pd.read_csv(csv_file, dtype={"headword": str, "shortDefinition": str})
+    counts = sparse.csc_matrix(data.iloc[:, 2:].fillna(0).to_numpy(dtype=np.float64))
+    matrix = frequencyMatrix.FrequencyMatrix(data.iloc[:, 0:2], list(data.columns[2:]), counts)
+    matrix.save(cache_directory, metadata={"source": source})
+    return Corpus(matrix, authors)
@@ -4,152 +4,158 @@ import shutil
 import pandas as pd
 import numpy as np
 import csv
+from scipy import sparse
+from concurrent.futures import ProcessPoolExecutor
 
+import frequencyMatrix
+import matrixStore
+import similarity
+import similarityStore
+import stageCache
+import streamingMerge
+import weighting
 
-def merge_csv_files(csv_directory: object, output_file: object, pattern: object = "- cleaned.csv") -> object:
-    # Initialize variables to store data and headers
-    data_list = []
-    headers = ["headword", "shortDefinition"]
+
+def find_frequency_files(csv_directory, pattern="- cleaned.csv"):
+    # Initialize the list of (file path, work label) pairs
+    files = []
 
     # Traverse the specified directory and its subdirectories
-    for root, dirs, files in os.walk(csv_directory):
-        for file in files:
-            # Check if the file ends with "- cleaned.csv"
+    for root, dirs, file_names in os.walk(csv_directory):
+        for file in file_names:
+            # Check if the file ends with the pattern
             if file.endswith(pattern):
-                # Build the full file path
-                file_path = os.path.join(root, file)
-
-                # Read the current CSV file as a DataFrame
-                current_data = pd.read_csv(file_path)
-
                 # Extract author and title from the file name
                 file_parts = os.path.splitext(os.path.basename(file))[0].split(" - ")
-                author_title = "-".join(file_parts[:2])
+                files.append((os.path.join(root, file), "-".join(file_parts[:2])))
 
-                # Add a new column for author and title
-                current_data["Author_Title"] = author_title
+    return files
 
-                # Append the current DataFrame to the list
-                data_list.append(current_data)
 
-                # Add author and title to the headers
-                headers.append(author_title)
+def work_author(work):
+    # Author of a work label built by find_frequency_files ("author-title"): the text before the first "-". Only a
+    # guess for the authors whose name has a "-"; the folder of the files, see work_authors, is the reliable source
+    return work.split("-", 1)[0]
 
-    # Check if any cleaned CSV files were found
-    if not data_list:
-        print("No cleaned CSV files found in the specified directory.")
-        return
 
-    # Concatenate all DataFrames into a single DataFrame
-    merged_data = pd.concat(data_list, ignore_index=True)
+def work_authors(files):
+    # Author of every work of find_frequency_files: the folder holding its files, as in merge_all_by_author
+    return {work: os.path.basename(os.path.dirname(file_path)) for file_path, work in files}
 
-    # Create an empty DataFrame with the headers
-    data = pd.DataFrame(columns=headers)
-    data.to_csv(output_file, index=False)
 
-    # Iterate over each row in the merged data
-    for _, row in merged_data.iterrows():
-        col_to_modify = row[3]
-        if col_to_modify in headers:
-            col_index = headers.index(col_to_modify)
+def read_frequency_file(file_path):
+    # Keep the lemma columns as text, so that headwords are never parsed as numbers
+    return pd.read_csv(file_path, dtype={"headword": str, "shortDefinition": str})
 
-            # Create a new row with zeros for all columns
-            row_data = [0] * len(headers)
-            row_data[0] = row[0]  # Copy headword
-            row_data[1] = row[1]  # Copy shortDefinition
-            row_data[col_index] = row[2]  # Set the value of the matching column
 
-            # Append the row to the output CSV file
-            with open(output_file, "a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow(row_data)
+def update_frequency_matrix(files, cache_directory, lemma_index=None):
+    """
+    Builds the frequency matrix of `files`, reusing the columns of the previous build stored in `cache_directory`.
 
-    # Read the temporary output file into a DataFrame
-    temp_data = pd.read_csv(output_file)
+    Args:
+        files: List of (file path, work label) pairs, as returned by find_frequency_files.
+        cache_directory: Directory holding the matrix of the previous build, see FrequencyMatrix.save. It is
+                         updated in place.
+        lemma_index: Optional lemmaIndex.LemmaIndex, see frequencyMatrix.build_frequency_matrix. The cache is only
+                     reused if it was built with the same index.
 
-    # Group the data by headword and shortDefinition, and sum the values
-    temp_data = temp_data.groupby(headers[:2]).sum().reset_index()
+    Returns:
+        The FrequencyMatrix of `files`, identical to building it from scratch.
 
-    # Drop duplicate rows based on the headword column
-    temp_data.drop_duplicates(subset=headers[0], keep="first", inplace=True)
+    Note:
+    - A work is re-read only if one of its files is new or its content hash changed, so adding a few works to a
+      large corpus only reads those works.
+    - Works that no longer have files are dropped, together with the lemmas only they contained.
+    """
 
-    # Write the final merged data to the output file
-    temp_data.to_csv(output_file, index=False)
+    # Hash the files of every work
+    work_hashes = {}
+    for file_path, work in files:
+        work_hashes.setdefault(work, []).append(stageCache.hash_file(file_path))
+    for hashes in work_hashes.values():
+        hashes.sort()
 
-    print("CSV files merged successfully.")
+    lemma_index_uid = lemma_index.uid if lemma_index is not None else None
 
+    cached_matrix, cached_hashes = None, {}
+    if frequencyMatrix.is_frequency_matrix(cache_directory):
+        cached_matrix, metadata = frequencyMatrix.load_frequency_matrix(cache_directory)
+        # Lemma ids of another index would not match the current ones
+        if metadata.get("lemma_index") == lemma_index_uid:
+            cached_hashes = metadata.get("work_hashes", {})
 
-def merge_all_csv_files(csv_directory, output_file, pattern=".csv"):
-    # Initialize variables to store data and headers
-    data_list = []
-    headers = ["headword", "shortDefinition"]
+    reused = [work for work in work_hashes if cached_hashes.get(work) == work_hashes[work]]
+    changed = [(file_path, work) for file_path, work in files if work not in reused]
 
-    # Traverse the specified directory and its subdirectories
-    for root, dirs, files in os.walk(csv_directory):
-        for file in files:
-            # Check if the file ends with "- cleaned.csv"
-            if file.endswith(pattern):
-                # Build the full file path
-                file_path = os.path.join(root, file)
+    parts = []
+    if reused:
+        parts.append(cached_matrix.select_works(reused))
+    if changed:
+        data_list = [read_frequency_file(file_path) for file_path, _ in changed]
+        parts.append(frequencyMatrix.build_frequency_matrix(data_list, [work for _, work in changed], lemma_index))
+    print(f"Frequency matrix: {len(reused)} works reused, {len(work_hashes) - len(reused)} rebuilt.")
 
-                # Read the current CSV file as a DataFrame
-                current_data = pd.read_csv(file_path)
+    # Restore the order in which the works were found
+    matrix = frequencyMatrix.combine_frequency_matrices(parts, lemma_index).select_works(list(work_hashes))
+    matrix.save(cache_directory, {"work_hashes": work_hashes, "lemma_index": lemma_index_uid})
+    return matrix
 
-                # Extract author and title from the file name
-                file_parts = os.path.splitext(os.path.basename(file))[0].split(" - ")
-                author_title = "-".join(file_parts[:2])
 
-                # Add a new column for author and title
-                current_data["Author_Title"] = author_title
+def merge_csv_files(csv_directory: object, output_file: object, pattern: object = "- cleaned.csv",
+                    cache_directory=None, matrix_directory=None, streaming=False, lemma_index=None) -> object:
+    """
+    Merges the frequency lists below `csv_directory` into "- all freq.csv", with one column per work.
+
+    With streaming=True the table is built by an out-of-core k-way merge (see streamingMerge.stream_merge), whose
+    memory does not grow with the corpus. No matrix is then built: the cache is not used, a previous matrix in
+    `matrix_directory` is removed so that the dataset stage reads the CSV instead, and None is returned.
 
-                # Append the current DataFrame to the list
-                data_list.append(current_data)
+    With a lemmaIndex.LemmaIndex as `lemma_index`, the lemmas are aggregated and ordered by their integer ids, which
+    are saved with the matrix.
+    """
 
-                # Add author and title to the headers
-                headers.append(author_title)
+    files = find_frequency_files(csv_directory, pattern)
 
     # Check if any cleaned CSV files were found
-    if not data_list:
+    if not files:
         print("No cleaned CSV files found in the specified directory.")
         return
 
-    # Concatenate all DataFrames into a single DataFrame
-    merged_data = pd.concat(data_list, ignore_index=True)
-
-    # Create an empty DataFrame with the headers
-    data = pd.DataFrame(columns=headers)
-    data.to_csv(output_file, index=False)
-
-    # Iterate over each row in the merged data
-    for _, row in merged_data.iterrows():
-        col_to_modify = row[3]
-        if col_to_modify in headers:
-            col_index = headers.index(col_to_modify)
+    if streaming:
+        if matrix_directory and os.path.isdir(matrix_directory):
+            shutil.rmtree(matrix_directory)
+        rows = streamingMerge.stream_merge(files, output_file, drop_duplicate_headwords=True)
+        print(f"CSV files merged successfully ({rows} lemmas, streaming).")
+        return
 
-            # Create a new row with zeros for all columns
-            row_data = [0] * len(headers)
-            row_data[0] = row[0]  # Copy headword
-            row_data[1] = row[1]  # Copy shortDefinition
-            row_data[col_index] = row[2]  # Set the value of the matching column
+    # Build the lemma x work matrix, incrementally when a cache of the previous build is available
+    if cache_directory:
+        matrix = update_frequency_matrix(files, cache_directory, lemma_index)
+    else:
+        data_list = [read_frequency_file(file_path) for file_path, _ in files]
+        matrix = frequencyMatrix.build_frequency_matrix(data_list, [work for _, work in files], lemma_index)
 
-            # Append the row to the output CSV file
-            with open(output_file, "a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow(row_data)
+    # Lemmas missing from the index have just been added to it
+    if lemma_index is not None:
+        lemma_index.save()
 
-    # Read the temporary output file into a DataFrame
-    temp_data = pd.read_csv(output_file)
+    # Keep the first row of every headword and write the matrix out
+    matrix = matrix.drop_duplicate_headwords()
+    matrix.to_csv(output_file)
 
-    # Group the data by headword and shortDefinition, and sum the values
-    temp_data = temp_data.groupby(headers[:2]).sum().reset_index()
+    # Also hand the matrix to the dataset stage in binary form, so that it does not parse the CSV again. The authors
+    # are saved with it, since they cannot always be told from the work labels
+    if matrix_directory:
+        matrix.save(matrix_directory, {"authors": work_authors(files)})
 
-    # Drop duplicate rows based on the headword column
-    temp_data.drop_duplicates(subset=headers[0], keep="first", inplace=True)
+    print("CSV files merged successfully.")
+    return matrix
 
-    # Write the final merged data to the output file
-    temp_data.to_csv(output_file, index=False)
 
-    print("CSV files merged successfully.")
+def merge_all_csv_files(csv_directory, output_file, pattern=".csv", cache_directory=None, matrix_directory=None,
+                        streaming=False, lemma_index=None):
+    return merge_csv_files(csv_directory, output_file, pattern, cache_directory, matrix_directory, streaming,
+                           lemma_index)
 
 
 def delete_files_with_pattern(dir, pattern="- freq author"):
@@ -166,134 +172,205 @@ def delete_files_with_pattern(dir, pattern="- freq author"):
                 print(f"Deleted folder: {folder_path}")
 
 
-def merge_csv_files_by_author(folder_path, output_file, pattern="- cleaned.csv"):
-    # Initialize variables to store data and headers
-    data_list = []
-    headers = ["headword", "shortDefinition"]
-
-    # Traverse the specified folder
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith(pattern):
-            file_path = os.path.join(folder_path, file_name)
-
-            # Read the current CSV file as a DataFrame
-            current_data = pd.read_csv(file_path)
+def sum_author_frequencies(folder_path, pattern="- cleaned.csv"):
+    """
+    Sums the frequency lists of the works in `folder_path` per lemma.
 
-            # Extract the author from the folder name
-            author = os.path.basename(folder_path)
+    Returns:
+        A DataFrame with the columns headword, shortDefinition and <author>, the name of the folder, with one row
+        per lemma sorted by (headword, shortDefinition), or None if the folder has no matching file.
+    """
 
-            # Add a new column for author
-            current_data["author"] = author
+    # Extract the author from the folder name
+    author = os.path.basename(folder_path)
 
-            # Append the current DataFrame to the list
-            data_list.append(current_data)
-
-            # Add author to the headers
-            headers.append(author)
+    # Read the matching files in a fixed order, keeping the lemma columns and the frequency column
+    file_names = sorted(file_name for file_name in os.listdir(folder_path) if file_name.endswith(pattern))
+    data_list = []
+    for file_name in file_names:
+        current_data = read_frequency_file(os.path.join(folder_path, file_name)).iloc[:, 0:3]
+        current_data.columns = ["headword", "shortDefinition", author]
+        data_list.append(current_data)
 
     # Check if any CSV files were found
     if not data_list:
-        print("No CSV files found in the specified folder.")
-        return
+        return None
 
-    # Concatenate all DataFrames into a single DataFrame
     merged_data = pd.concat(data_list, ignore_index=True)
+    merged_data[author] = pd.to_numeric(merged_data[author], errors="coerce")
+    return merged_data.groupby(["headword", "shortDefinition"]).sum().reset_index()
 
-    # Create an empty DataFrame with the headers
-    data = pd.DataFrame(columns=headers)
-    data.to_csv(output_file, index=False)
 
-    # Iterate over each row in the merged data
-    for _, row in merged_data.iterrows():
-        col_to_modify = row[3]  # Assuming the data starts from the fourth column
-        if col_to_modify in headers:
-            col_index = headers.index(col_to_modify)
+def merge_csv_files_by_author(folder_path, output_file, pattern="- cleaned.csv"):
+    """
+    Writes the frequency lists of the works in `folder_path` summed per lemma into one author file, see
+    sum_author_frequencies.
 
-            # Create a new row with zeros for all columns
-            row_data = [0] * len(headers)
-            row_data[0] = row[0]  # Copy headword
-            row_data[1] = row[1]  # Copy shortDefinition
-            row_data[col_index] = row[2]  # Set the value of the matching column
+    Returns:
+        The number of lemmas written, or None if the folder has no matching file.
+    """
 
-            # Append the row to the output CSV file
-            with open(output_file, "a", newline="", encoding="utf-8") as file:
-                writer = csv.writer(file)
-                writer.writerow(row_data)
+    author_data = sum_author_frequencies(folder_path, pattern)
+    if author_data is None:
+        print("No CSV files found in the specified folder.")
+        return None
 
-    # Read the temporary output file into a DataFrame
-    temp_data = pd.read_csv(output_file)
+    author_data.to_csv(output_file, index=False)
 
-    # Sum the values for numeric columns after the second one (author column)
-    numeric_cols = temp_data.columns[2:].tolist()
-    temp_data[numeric_cols] = temp_data[numeric_cols].apply(pd.to_numeric, errors="coerce")
+    print("CSV files merged and columns summed successfully.")
+    return len(author_data)
 
-    # Group by "author" column and sum the numeric columns
-    temp_data[2] = temp_data.iloc[1:, 2:].sum()
 
-    # Write the final merged and summed data to the output file
-    temp_data.iloc[:, 0:3].to_csv(output_file, index=False)
+def merge_all_by_author(folder_path, out_loc, pattern="- cleaned.csv", reverse=False, workers=None,
+                        streaming=False, lemma_index=None):
+    """
+    Sums the works of every author folder below `folder_path` per lemma, then merges the authors into
+    "- all freq.csv" in `out_loc`, with one column per author.
 
-    print("CSV files merged and columns summed successfully.")
+    The author folders are summed in parallel and returned to this process, which merges them in the order of the
+    author names, so the output does not depend on which folder finished first.
 
+    Args:
+        workers: Number of processes summing author folders in parallel. None uses one per CPU, 1 sums the
+                 folders one after the other in the current process.
+        streaming: Write one "<author> - freq author.csv" file per author into `out_loc` and merge them with the
+                   out-of-core merge of merge_authors, so that the authors are never all held in memory.
+        lemma_index: Optional lemmaIndex.LemmaIndex, see merge_author_frequencies.
+    """
 
-def merge_all_by_author(folder_path, out_loc, pattern="- cleaned.csv", reverse=False):
     os.makedirs(out_loc, exist_ok=True)
-    for root, dirs, files in os.walk(folder_path):
-        for dir in dirs:
-            file_name = dir + " - freq author" + ".csv"
-            dir_loc = os.path.join(root, dir)
-            file_loc = os.path.join(out_loc, file_name)
-            print(file_name)
-            merge_csv_files_by_author(dir_loc, file_loc)
-    merge_authors(out_loc,
-                  os.path.join(out_loc, "- all freq.csv"),
-                  pattern=" - freq author.csv")
-
-
-def merge_authors(csv_directory, output_file, pattern="- cleaned.csv"):
+
+    folders = sorted((os.path.join(root, dir) for root, dirs, files in os.walk(folder_path) for dir in dirs),
+                     key=os.path.basename)
+    if streaming:
+        function = merge_csv_files_by_author
+        jobs = [(folder, os.path.join(out_loc, os.path.basename(folder) + " - freq author" + ".csv"), pattern)
+                for folder in folders]
+    else:
+        function = sum_author_frequencies
+        jobs = [(folder, pattern) for folder in folders]
+
+    def report(results):
+        for folder, result in zip(folders, results):
+            print(os.path.basename(folder))
+            yield result
+
+    if workers == 1:
+        results = list(report(function(*job) for job in jobs))
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # An author folder that failed raises here, when its result is reached
+            results = list(report(executor.map(function, *zip(*jobs))))
+    else:
+        results = []
+
+    output_file = os.path.join(out_loc, "- all freq.csv")
+    if streaming:
+        merge_authors(out_loc, output_file, pattern=" - freq author.csv", streaming=True, lemma_index=lemma_index)
+    else:
+        author_data = [data for data in results if data is not None]
+        if not author_data:
+            print("No cleaned CSV files found in the specified directory.")
+            return
+        merge_author_frequencies(author_data, output_file, lemma_index)
+
+
+def author_groups(csv_directory, pattern="- cleaned.csv"):
+    # Author of every work below `csv_directory`, see work_authors
+    return work_authors(find_frequency_files(csv_directory, pattern))
+
+
+def read_groups(csv_file):
+    """
+    Reads a grouping of the works, e.g. by genre or period, from a CSV file with a "work" column holding the work
+    labels of "- all freq.csv" ("author-title") and a "group" column. Works not listed belong to no group.
+    """
+
+    data = pd.read_csv(csv_file, dtype=str).dropna(subset=["work", "group"])
+    return dict(zip(data["work"], data["group"]))
+
+
+def merge_by_group(matrix, groups, output_file, matrix_directory=None, metadata=None):
+    """
+    Writes "- all freq.csv" with one column per group of works, summed from the per-work matrix.
+
+    This gives the table merge_all_by_author builds from the per-work files, for authors or for any other grouping,
+    with one sparse product instead of another pass over the files.
+
+    Args:
+        matrix: frequencyMatrix.FrequencyMatrix with one column per work and every lemma of the works, e.g. the
+                merge cache of merge_csv_files.
+        groups: Dict mapping work labels to their group, see author_groups and read_groups.
+        output_file: Path of the CSV file to write.
+        matrix_directory: Optional directory where the grouped matrix is also saved for the dataset stage.
+        metadata: Optional dict saved with the grouped matrix, see FrequencyMatrix.save.
+
+    Returns:
+        The grouped FrequencyMatrix.
+    """
+
+    grouped = matrix.group_works(groups)
+    grouped.to_csv(output_file)
+    if matrix_directory:
+        grouped.save(matrix_directory, metadata)
+
+    print(f"{matrix.shape[1]} works grouped into {grouped.shape[1]} columns.")
+    return grouped
+
+
+def merge_authors(csv_directory, output_file, pattern="- cleaned.csv", streaming=False, lemma_index=None):
+    """
+    Sums the per-author files of `csv_directory` into one table with a column per author.
+
+    The files are read in sorted order, so the columns of the output do not depend on the order in which the
+    author files were written. With streaming=True the same table is built by an out-of-core k-way merge, see
+    streamingMerge.stream_merge, instead of concatenating every file in memory. With a lemmaIndex.LemmaIndex as
+    `lemma_index`, the rows are grouped and ordered by their integer lemma ids rather than by the strings.
+    """
+
     # Find files that match the pattern in the specified directory
-    files = [file for file in os.listdir(csv_directory) if file.endswith(pattern)]
+    files = sorted(file for file in os.listdir(csv_directory) if file.endswith(pattern))
 
     # Check if any cleaned CSV files were found
     if not files:
         print("No cleaned CSV files found in the specified directory.")
         return
 
-    # Initialize variables to store data and headers
-    data_list = []
-    headers = ["headword", "shortDefinition"]
-
-    # Read and process each file
-    for i, file in enumerate(files):
-        # Build the full file path
-        file_path = os.path.join(csv_directory, file)
-
-        # Read the current CSV file as a DataFrame
-        current_data = pd.read_csv(file_path)
-
-        # Extract the column name for the current file
-        column_name = os.path.splitext(file)[0]
+    if streaming:
+        # The frequency column of every file is named after its author
+        authors = [(os.path.join(csv_directory, file),
+                    pd.read_csv(os.path.join(csv_directory, file), nrows=0).columns[2]) for file in files]
+        # pandas turns the author columns into floats when it fills them with NaN for the other authors
+        rows = streamingMerge.stream_merge(authors, output_file, force_float=len(set(dict(authors).values())) > 1)
+        print(f"CSV files merged successfully ({rows} lemmas, streaming).")
+        return
 
-        # Create a new column for the current file
-        current_data[column_name] = current_data.iloc[:, 2]
+    # Keep the lemma columns and the frequency column, which is named after the author
+    data_list = [read_frequency_file(os.path.join(csv_directory, file)).iloc[:, 0:3] for file in files]
+    merge_author_frequencies(data_list, output_file, lemma_index)
 
-        # Fill empty positions with zeros
-        current_data[column_name].fillna(0, inplace=True)
 
-        # Append the current DataFrame to the list
-        data_list.append(current_data)
+def merge_author_frequencies(data_list, output_file, lemma_index=None):
+    """
+    Sums per-author tables, each with the columns headword, shortDefinition and <author>, into `output_file`, with
+    one column per author in the order of `data_list`.
 
-        # Add the current column name to the headers
-        headers.append(column_name)
+    With a lemmaIndex.LemmaIndex as `lemma_index`, the rows are grouped and ordered by their integer lemma ids
+    rather than by the strings.
+    """
 
-    # Concatenate all DataFrames into a single DataFrame
+    # Concatenate all DataFrames: every row has a value in its own author column and NaN in the others
     merged_data = pd.concat(data_list, ignore_index=True)
 
-    # Remove columns whose first row contains "freq author"
-    merged_data = merged_data.loc[:, ~merged_data.columns.str.contains("freq author")]
-
     # Group the data by headword and shortDefinition, and sum the values
-    merged_data = merged_data.groupby(headers[:2]).sum().reset_index()
+    if lemma_index is not None:
+        merged_data = merged_data.dropna(subset=frequencyMatrix.LEMMA_COLUMNS)
+        rows, lemma_ids = lemma_index.factorize(lemma_index.intern(merged_data[frequencyMatrix.LEMMA_COLUMNS]))
+        sums = merged_data.iloc[:, 2:].groupby(rows).sum().reset_index(drop=True)
+        merged_data = pd.concat([lemma_index.lemmas(lemma_ids), sums], axis=1)
+        lemma_index.save()
+    else:
+        merged_data = merged_data.groupby(["headword", "shortDefinition"]).sum().reset_index()
 
     # Write the merged data to the output file
     merged_data.to_csv(output_file, index=False)
@@ -301,17 +378,16 @@ def merge_authors(csv_directory, output_file, pattern="- cleaned.csv"):
     print("CSV files merged successfully.")
 
 
-def calculate_percentages(input_file, output_file):
-    data = pd.read_csv(input_file)
-    percent_data = data.copy()
-    numeric_cols = percent_data.columns
-
-    for col in numeric_cols:
-        print(col)
-        percent_data[col] = (percent_data[col] / percent_data[col].sum()) * 100
-        percent_data[col] = percent_data[col].apply(lambda x: f"{x:.4f}")
+def calculate_percentages(input_file, output_file, mode="relative"):
+    """
+    Writes the percentage of every lemma in every work, or another weighting of the counts, see
+    weighting.weight_matrix for the modes. The whole matrix is divided by its column sums in one operation, and
+    works without any count get 0 rather than NaN.
+    """
 
-    percent_data.to_csv(output_file, index=False)
+    data = pd.read_csv(input_file)
+    weighted = weighting.weight_matrix(data.fillna(0).to_numpy(dtype=np.float64), mode)
+    pd.DataFrame(weighted, columns=data.columns).to_csv(output_file, index=False, float_format="%.4f")
 
     print("Percentages calculated and written to file.")
 
@@ -344,6 +420,60 @@ def add_progressive_numbering(input_file, output_file_dict, output_file):
     print(f"First two columns removed from '{output_file}'.")
 
 
+def add_progressive_numbering_from_matrix(matrix, output_file_dict, output_file):
+    # Same outputs as add_progressive_numbering, written from an in-memory FrequencyMatrix. When the matrix has
+    # lemma ids, the dictionary also gets their stable ids, which do not change when works are added
+    with open(output_file_dict, 'w', newline='', encoding='utf-8') as output_csv:
+        writer = csv.writer(output_csv)
+        if matrix.lemma_ids is None:
+            writer.writerow(frequencyMatrix.LEMMA_COLUMNS + ['Number'])
+            for i, (headword, short_definition) in enumerate(matrix.lemmas.itertuples(index=False), start=1):
+                writer.writerow([headword, short_definition, i])
+        else:
+            writer.writerow(frequencyMatrix.LEMMA_COLUMNS + ['Number', 'Lemma id'])
+            for i, (headword, short_definition, lemma_id) in enumerate(
+                    zip(matrix.lemmas["headword"], matrix.lemmas["shortDefinition"], matrix.lemma_ids.tolist()),
+                    start=1):
+                writer.writerow([headword, short_definition, i, lemma_id])
+
+    print(f"Progressive numbering added to '{output_file_dict}'.")
+
+    matrix.to_csv(output_file, lemma_columns=False)
+
+    print(f"First two columns removed from '{output_file}'.")
+
+
+def calculate_percentages_from_matrix(matrix, output_file, mode="relative"):
+    # Weight the whole matrix at once, keeping it sparse; empty columns stay at zero
+    percent_matrix = frequencyMatrix.FrequencyMatrix(matrix.lemmas, matrix.works,
+                                                     weighting.weight_matrix(matrix.counts, mode), matrix.lemma_ids)
+
+    percent_matrix.to_csv(output_file, lemma_columns=False, float_format="%.4f")
+
+    print("Percentages calculated and written to file.")
+    return percent_matrix
+
+
+def calculate_percentages_from_store(store, output_file, store_path, block_rows=10000, mode="relative"):
+    # Same output as calculate_percentages, computed one block of rows at a time from a memory-mapped MatrixStore
+    sums = store.column_sums(block_rows) if mode != "log" else None
+
+    pd.DataFrame(columns=store.columns).to_csv(output_file, index=False)
+
+    def percent_blocks():
+        for _, _, block in store.iter_row_blocks(block_rows):
+            percent_block = weighting.weight_matrix(block, mode, column_sums=sums)
+            pd.DataFrame(percent_block, columns=store.columns).to_csv(output_file, mode='a', header=False,
+                                                                      index=False, float_format="%.4f")
+            yield percent_block
+
+    # The percentages are also kept in a store of their own for the similarity step
+    percent_store = matrixStore.write_store(store_path, percent_blocks(), store.columns)
+
+    print("Percentages calculated and written to file.")
+    return percent_store
+
+
 def cosine_similarity(vector1, vector2):
     dot_product = np.dot(vector1, vector2)
     norm_product = np.linalg.norm(vector1) * np.linalg.norm(vector2)
@@ -353,31 +483,88 @@ def cosine_similarity(vector1, vector2):
     return similarity
 
 
-def calculate_similarity_matrix(input_file, output_file):
+def calculate_similarity_matrix(input_file, output_file, block_size=None):
     # Read the input data into a DataFrame
     data = pd.read_csv(input_file)
 
-    # Write the first row of data to the output file
-    first_row = data.columns.values
+    # Compute the similarity matrix between all the columns at once
+    similarity_matrix = similarity.cosine_similarity_matrix(data.to_numpy(dtype=float), block_size)
+
+    write_similarity_matrix(similarity_matrix, data.columns.values, output_file)
+
+
+def calculate_similarity_matrix_from_matrix(matrix, output_file, block_size=None, store_path=None):
+    # Same output as calculate_similarity_matrix, computed from the sparse percentages of a FrequencyMatrix.
+    # With a store_path, the similarities are kept in a similarityStore.SimilarityStore there, and only those of
+    # the works added or changed since the previous call are computed
+    if store_path:
+        store = similarityStore.SimilarityStore(store_path)
+        store.update(matrix)
+        similarity_matrix = store.similarities(matrix.works)
+    else:
+        similarity_matrix = similarity.cosine_similarity_matrix(matrix.counts, block_size)
+
+    write_similarity_matrix(similarity_matrix, matrix.works, output_file)
+
+
+def calculate_similarity_matrix_from_store(store, output_file, block_rows=10000):
+    # Same output as calculate_similarity_matrix, reading a memory-mapped MatrixStore one block of rows at a time
+    blocks = (block for _, _, block in store.iter_row_blocks(block_rows))
+    similarity_matrix = similarity.cosine_similarity_from_blocks(blocks, store.shape[1])
+
+    write_similarity_matrix(similarity_matrix, store.columns, output_file)
+
+
+def write_similarity_matrix(similarity_matrix, headers, output_file):
+    # Write the headers to their own file and the matrix without them
+    write_headers(output_file, headers)
     with open(output_file, 'w', newline='') as file:
         writer = csv.writer(file)
-        writer.writerow(first_row)
+        writer.writerows(similarity_matrix)
+
+
+def calculate_nearest_works_from_matrix(matrix, output_file, k=20, **index_options):
+    # Approximate counterpart of calculate_similarity_matrix_from_matrix for large corpora: only the k nearest works
+    # of every work are written, found with a similarity.RandomProjectionIndex instead of the N x N matrix
+    index = similarity.RandomProjectionIndex(matrix.counts, **index_options)
+    write_nearest_works(index, matrix.works, output_file, k)
 
-    # Compute the similarity matrix between each pair of columns
-    similarity_matrix = np.zeros((data.shape[1], data.shape[1]))
-    for i in range(0, data.shape[1]):
-        for j in range(i, data.shape[1]):
-            similarity_value = cosine_similarity(data.iloc[:, i].values, data.iloc[:, j].values)
-            similarity_matrix[i, j] = similarity_value
-            similarity_matrix[j, i] = similarity_value
 
-    # Append the similarity matrix to the output file
-    with open(output_file, 'a', newline='') as file:
+def calculate_nearest_works_from_store(store, output_file, k=20, block_rows=10000, **index_options):
+    # Same output as calculate_nearest_works_from_matrix, from a memory-mapped MatrixStore; only its non-zero
+    # values are kept in memory
+    counts = sparse.vstack([sparse.csr_matrix(block) for _, _, block in store.iter_row_blocks(block_rows)])
+    index = similarity.RandomProjectionIndex(counts, **index_options)
+    write_nearest_works(index, store.columns, output_file, k)
+
+
+def write_nearest_works(index, works, output_file, k):
+    # One row per (work, neighbour) pair, the neighbours of every work from the most to the least similar
+    with open(output_file, 'w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerows(similarity_matrix)
+        writer.writerow(["work", "rank", "neighbour", "similarity"])
+        for column, work in enumerate(works):
+            for rank, (neighbour, score) in enumerate(index.query(column, k), start=1):
+                writer.writerow([work, rank, works[neighbour], score])
+
+    print(f"Nearest works written to '{output_file}'.")
+
+
+def find_similar_works(input_file, work, k=20):
+    """
+    Returns the k works most similar to `work` as a list of (work, similarity) tuples, most similar first.
 
-    get_headers(output_file)
-    remove_first_row(output_file)
+    Only the similarities involving `work` are computed, not the whole matrix.
+
+    Args:
+        input_file: Frequency or percentage CSV with one column per work, like "- all perc.csv".
+        work: Column name of the query work.
+        k: Number of works to return.
+    """
+
+    data = pd.read_csv(input_file)
+    neighbours = similarity.top_k_similar(data.to_numpy(dtype=float), data.columns.get_loc(work), k)
+    return [(data.columns[index], score) for index, score in neighbours]
 
 
 def prepend_vector_to_csv(input_file, output_file):
@@ -409,8 +596,10 @@ def get_headers(input_file):
         reader = csv.reader(file)
         data = list(reader)
 
-    first_row = data[0]
+    write_headers(input_file, data[0])
+
 
+def write_headers(input_file, first_row):
     dir_name = os.path.dirname(input_file)
     base_name = os.path.basename(input_file)
     output_name = os.path.splitext(base_name)[0] + " - headers.csv"
@@ -0,0 +1,259 @@
+"""
+Serves the datasets written by main.create_Dataset over HTTP, from one warm in-memory copy shared by all clients.
+
+Usage, from the repository root:
+    python -m datasetService <work directory> [port]
+
+where <work directory> is the "classicalTextFrequencies" folder. Every dataset directory found below its "greek
+output" and "latin output" folders is loaded once at start-up and served under its relative path, e.g.
+"greek output/All Works - pure". All endpoints answer GET requests with JSON:
+
+    /datasets                                           the datasets and their number of lemmas and works
+    /lemma?dataset=...&headword=...[&shortDefinition=...][&n=10][&by=percentage]
+                                                        the works that use a lemma most, with count and percentage
+    /similarity?dataset=...&work=...&other=...          the similarity of two works
+    /similar?dataset=...&work=...[&k=20]                the k works most similar to a work
+    /top-lemmas?dataset=...&(work=...|author=...)[&n=20][&weighted=1]
+                                                        the most frequent lemmas of a work or of an author
+    /prefix?dataset=...&prefix=...[&limit=50]           the lemmas whose headword starts with a prefix
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import corpusIndex
+import csvAnalysis
+import similarity
+
+# Folders of run_all holding the dataset directories, and the folder of the per-work files of each
+OUTPUT_DIRECTORIES = {"greek output": "greek", "latin output": "latin"}
+
+
+class Dataset:
+    """
+    One dataset directory held in memory: its corpusIndex.Corpus and its similarity matrix.
+
+    The similarity matrix is read from "- similarity matrix.csv" when create_Dataset wrote it, so that the service
+    returns the similarities of the weighting the dataset was built with; otherwise the similarities of a work are
+    computed from the percentages when they are asked for, and its most similar works are searched approximately
+    with a similarity.RandomProjectionIndex built on the first such query.
+    """
+
+    def __init__(self, directory, authors=None):
+        self.corpus = corpusIndex.load_corpus(directory, authors)
+        self.similarities = None
+        self.index = None
+        # The requests are answered by several threads, which must not build the index twice nor see it half built
+        self.index_lock = threading.Lock()
+
+        similarity_file = os.path.join(directory, "- similarity matrix.csv")
+        headers_file = os.path.join(directory, "- similarity matrix - headers.csv")
+        if os.path.isfile(similarity_file) and os.path.isfile(headers_file):
+            headers = pd.read_csv(headers_file, nrows=0).columns.tolist()
+            if headers == self.corpus.works:
+                self.similarities = pd.read_csv(similarity_file, header=None, dtype=np.float64).to_numpy()
+
+    def nearest_works_index(self):
+        with self.index_lock:
+            if self.index is None:
+                self.index = similarity.RandomProjectionIndex(self.corpus.counts @ sparse.diags(self.corpus.scale))
+            return self.index
+
+    def similarity(self, work, other):
+        columns = self.corpus.work_columns
+        if self.similarities is not None:
+            return float(self.similarities[columns[work], columns[other]])
+        # The cosine similarity of the counts is that of the percentages, which only scale every column
+        pair = self.corpus.counts[:, [columns[work], columns[other]]]
+        return float(similarity.cosine_similarity_matrix(pair)[0, 1])
+
+    def similar(self, work, k=20):
+        column = self.corpus.work_columns[work]
+        if self.similarities is None:
+            neighbours = self.nearest_works_index().query(column, k)
+        else:
+            scores = self.similarities[column].copy()
+            scores[column] = -np.inf
+            k = min(k, len(scores) - 1)
+            best = np.argpartition(-scores, k - 1)[:k] if k > 0 else np.array([], dtype=np.int64)
+            best = best[np.argsort(-scores[best], kind="stable")]
+            neighbours = [(int(index), float(scores[index])) for index in best]
+        return [(self.corpus.works[index], score) for index, score in neighbours]
+
+
+def language_authors(work_directory, output_directory):
+    """
+    Returns the author of every work whose files are in the language folder of `output_directory`, taken from the
+    folder of the files as run_all does for "By Author", whose author columns are mapped to themselves.
+    """
+
+    if output_directory not in OUTPUT_DIRECTORIES:
+        return {}
+    authors = csvAnalysis.author_groups(os.path.join(work_directory, OUTPUT_DIRECTORIES[output_directory]), ".csv")
+    return {**authors, **{author: author for author in set(authors.values())}}
+
+
+def find_datasets(work_directory):
+    """
+    Returns the relative paths of the dataset directories below the output folders of `work_directory`.
+    """
+
+    datasets = []
+    for output_directory in OUTPUT_DIRECTORIES:
+        root = os.path.join(work_directory, output_directory)
+        if not os.path.isdir(root):
+            continue
+        for name in sorted(os.listdir(root)):
+            if os.path.isfile(os.path.join(root, name, "- all freq.csv")):
+                datasets.append(f"{output_directory}/{name}")
+    return datasets
+
+
+class DatasetService:
+    """
+    Answers the queries of the HTTP endpoints from datasets loaded once.
+
+    Responses are cached by request, so repeated queries are served without touching the data again; the data never
+    changes while the service runs, so the cache is never stale.
+    """
+
+    def __init__(self, work_directory, datasets=None, cache_size=4096):
+        self.datasets = {}
+        authors = {}
+        for name in datasets or find_datasets(work_directory):
+            output_directory = name.split("/", 1)[0]
+            if output_directory not in authors:
+                authors[output_directory] = language_authors(work_directory, output_directory)
+            self.datasets[name] = Dataset(os.path.join(work_directory, name), authors[output_directory])
+            print(f"Loaded dataset {name}: {self.datasets[name].corpus.shape[0]} lemmas, "
+                  f"{self.datasets[name].corpus.shape[1]} works.")
+
+        self.respond = functools.lru_cache(maxsize=cache_size)(self.answer)
+        self.endpoints = {
+            "/datasets": self.list_datasets,
+            "/lemma": self.lemma,
+            "/similarity": self.similarity,
+            "/similar": self.similar,
+            "/top-lemmas": self.top_lemmas,
+            "/prefix": self.prefix,
+        }
+
+    def answer(self, path, query):
+        """
+        Returns the (HTTP status, JSON body) of a request. Called through the cached `respond`.
+        """
+
+        endpoint = self.endpoints.get(path)
+        if endpoint is None:
+            return 404, json.dumps({"error": f"Unknown endpoint {path}"}).encode("utf-8")
+
+        params = {key: values[-1] for key, values in urllib.parse.parse_qs(query).items()}
+        try:
+            result = endpoint(params)
+        except KeyError as error:
+            return 404, json.dumps({"error": f"Not found: {error.args[0]}"}, ensure_ascii=False).encode("utf-8")
+        except ValueError as error:
+            return 400, json.dumps({"error": str(error)}, ensure_ascii=False).encode("utf-8")
+        return 200, json.dumps(result, ensure_ascii=False).encode("utf-8")
+
+    def dataset(self, params):
+        if "dataset" not in params:
+            raise ValueError("Missing parameter dataset")
+        return self.datasets[params["dataset"]]
+
+    @staticmethod
+    def required(params, name):
+        if name not in params:
+            raise ValueError(f"Missing parameter {name}")
+        return params[name]
+
+    def list_datasets(self, params):
+        return [{"dataset": name, "lemmas": dataset.corpus.shape[0], "works": dataset.corpus.shape[1]}
+                for name, dataset in self.datasets.items()]
+
+    def lemma(self, params):
+        corpus = self.dataset(params).corpus
+        works = corpus.works_using(self.required(params, "headword"), params.get("shortDefinition"),
+                                   n=int(params.get("n", 10)), by=params.get("by", "percentage"))
+        return [{"work": work, "count": count, "percentage": percentage} for work, count, percentage in works]
+
+    def similarity(self, params):
+        dataset = self.dataset(params)
+        return {"similarity": dataset.similarity(self.required(params, "work"), self.required(params, "other"))}
+
+    def similar(self, params):
+        neighbours = self.dataset(params).similar(self.required(params, "work"), int(params.get("k", 20)))
+        return [{"work": work, "similarity": score} for work, score in neighbours]
+
+    def top_lemmas(self, params):
+        corpus = self.dataset(params).corpus
+        weighted = params.get("weighted", "0") not in ("0", "false", "")
+        n = int(params.get("n", 20))
+        if "author" in params:
+            lemmas = corpus.top_lemmas_by_author(params["author"], n, weighted)
+        else:
+            lemmas = corpus.top_lemmas(self.required(params, "work"), n, weighted)
+        return [{"headword": headword, "shortDefinition": short_definition, "value": value}
+                for headword, short_definition, value in lemmas]
+
+    def prefix(self, params):
+        lemmas = self.dataset(params).corpus.prefix_search(self.required(params, "prefix"),
+                                                           int(params.get("limit", 50)))
+        return [{"headword": headword, "shortDefinition": short_definition}
+                for headword, short_definition in lemmas]
+
+
+def create_server(service, host="127.0.0.1", port=8000):
+    """
+    Creates a ThreadingHTTPServer answering the requests with `service`, one thread per connection.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            status, body = service.respond(url.path.rstrip("/") or "/", url.query)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # One line per request is too much for a service answering in microseconds
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def serve(work_directory, host="127.0.0.1", port=8000):
+    """
+    Loads the datasets of `work_directory` and serves them until interrupted.
+    """
+
+    server = create_server(DatasetService(work_directory), host, port)
+    print(f"Serving {work_directory} on http://{host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    work_directory = sys.argv[1]
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    serve(work_directory, port=port)
+
+
+if __name__ == "__main__":
+    main()
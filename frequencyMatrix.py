@@ -0,0 +1,288 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+LEMMA_COLUMNS = ["headword", "shortDefinition"]
+
+# Arrays of the compressed sparse column form, saved as one .npy file each
+MATRIX_ARRAYS = ["data", "indices", "indptr"]
+
+# Ids of the rows in a lemmaIndex.LemmaIndex, saved when the matrix has them
+LEMMA_IDS_FILE = "lemma_ids.npy"
+
+# Directory next to "- all freq.csv" where the merge saves the matrix for the dataset stage and corpusIndex
+MATRIX_DIRECTORY = "- all freq matrix"
+
+
+class FrequencyMatrix:
+    """
+    Sparse lemma x work frequency matrix.
+
+    Rows are lemmas identified by (headword, shortDefinition) and columns are works. The counts are kept in
+    compressed sparse column form, so only the non-zero cells are ever stored; the matrix is densified only
+    when it is written out.
+
+    Attributes:
+        lemmas: DataFrame with the "headword" and "shortDefinition" of each row, in row order.
+        works: List with the label of each column, in column order.
+        counts: scipy.sparse.csc_matrix of shape (len(lemmas), len(works)).
+        lemma_ids: Array with the id of each row in a lemmaIndex.LemmaIndex, or None.
+    """
+
+    def __init__(self, lemmas, works, counts, lemma_ids=None):
+        self.lemmas = lemmas.reset_index(drop=True)
+        self.works = list(works)
+        self.counts = sparse.csc_matrix(counts)
+        self.lemma_ids = None if lemma_ids is None else np.asarray(lemma_ids, dtype=np.int64)
+
+    def take_rows(self, rows):
+        ids = None if self.lemma_ids is None else self.lemma_ids[rows]
+        return FrequencyMatrix(self.lemmas.iloc[rows], self.works, self.counts[rows, :], ids)
+
+    @property
+    def shape(self):
+        return self.counts.shape
+
+    def drop_duplicate_headwords(self):
+        """
+        Keeps only the first row of every headword, like DataFrame.drop_duplicates(subset="headword").
+        """
+
+        keep = np.flatnonzero(~self.lemmas["headword"].duplicated(keep="first").to_numpy())
+        return self.take_rows(keep)
+
+    def select_works(self, works):
+        """
+        Returns the matrix restricted to `works`, in that order.
+
+        Lemmas left without any entry are dropped, so the result is the matrix that would have been built
+        from those works alone. Entries are tracked by presence, not value: a lemma listed with a frequency
+        of 0 keeps its row.
+        """
+
+        positions = {work: i for i, work in enumerate(self.works)}
+        counts = self.counts[:, [positions[work] for work in works]]
+        keep = np.flatnonzero(counts.getnnz(axis=1))
+        ids = None if self.lemma_ids is None else self.lemma_ids[keep]
+        return FrequencyMatrix(self.lemmas.iloc[keep], works, counts[keep, :], ids)
+
+    def group_works(self, groups):
+        """
+        Returns the matrix with one column per group of works, holding the sum of the columns of its works.
+
+        The columns are summed with a single product by the work -> group indicator matrix, see group_indicator, so
+        the per-work files are never read again.
+
+        Args:
+            groups: Dict mapping work labels to their group, e.g. their author, genre or period. Works without a
+                    group are left out, together with the lemmas only they contained.
+
+        Returns:
+            A FrequencyMatrix whose columns are the groups in sorted order.
+        """
+
+        labels, indicator = group_indicator(self.works, groups, dtype=self.counts.dtype)
+        counts = sparse.csc_matrix(self.counts @ indicator)
+        # Keep the lemmas listed by a grouped work, by presence as in select_works
+        grouped_works = np.flatnonzero(indicator.getnnz(axis=1))
+        keep = np.flatnonzero(self.counts[:, grouped_works].getnnz(axis=1))
+        ids = None if self.lemma_ids is None else self.lemma_ids[keep]
+        return FrequencyMatrix(self.lemmas.iloc[keep], labels, counts[keep, :], ids)
+
+    def save(self, directory, metadata=None):
+        """
+        Saves the matrix to `directory` in a compact binary form that load_frequency_matrix can memory-map.
+
+        The CSC arrays are stored as .npy files and the interned lemma and work labels, together with the optional
+        JSON-serialisable `metadata` dict, in "dictionary.json", which is written last.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        for name in MATRIX_ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self.counts, name))
+        if self.lemma_ids is not None:
+            np.save(os.path.join(directory, LEMMA_IDS_FILE), self.lemma_ids)
+        elif os.path.isfile(os.path.join(directory, LEMMA_IDS_FILE)):
+            os.remove(os.path.join(directory, LEMMA_IDS_FILE))
+
+        dictionary = {
+            "shape": list(self.shape),
+            "works": self.works,
+            "headwords": self.lemmas["headword"].tolist(),
+            "shortDefinitions": self.lemmas["shortDefinition"].tolist(),
+            "metadata": metadata or {},
+        }
+        temp_file = os.path.join(directory, "dictionary.json.tmp")
+        with open(temp_file, "w", encoding="utf-8") as file:
+            json.dump(dictionary, file, ensure_ascii=False)
+        os.replace(temp_file, os.path.join(directory, "dictionary.json"))
+
+    def to_dataframe(self):
+        """
+        Densifies the matrix into a DataFrame with the lemma columns followed by one column per work.
+        """
+
+        data = pd.DataFrame(self.counts.toarray(), columns=self.works)
+        return pd.concat([self.lemmas, data], axis=1)
+
+    def to_csv(self, output_file, chunk_size=10000, lemma_columns=True, float_format=None):
+        """
+        Writes the matrix in the "- all freq.csv" layout (headword, shortDefinition, one column per work).
+
+        Args:
+            output_file: Path of the CSV file to write.
+            chunk_size: Number of rows densified at a time, which bounds the memory used by the write.
+            lemma_columns: Whether to write the headword and shortDefinition columns.
+            float_format: Format string for floating point values, e.g. "%.4f".
+        """
+
+        rows = self.counts.tocsr()
+        header = (LEMMA_COLUMNS if lemma_columns else []) + self.works
+        pd.DataFrame(columns=header).to_csv(output_file, index=False)
+
+        for start in range(0, self.shape[0], chunk_size):
+            stop = min(start + chunk_size, self.shape[0])
+            block = pd.DataFrame(rows[start:stop].toarray(), columns=self.works)
+            if lemma_columns:
+                block = pd.concat([self.lemmas.iloc[start:stop].reset_index(drop=True), block], axis=1)
+            block.to_csv(output_file, mode='a', header=False, index=False, float_format=float_format)
+
+
+def build_frequency_matrix(frames, works, lemma_index=None):
+    """
+    Builds a FrequencyMatrix in a single pass over per-work frequency tables.
+
+    Args:
+        frames: List of DataFrames whose first three columns are headword, shortDefinition and frequency.
+        works: List with the work label of each DataFrame. Repeated labels are summed into the same column.
+        lemma_index: Optional lemmaIndex.LemmaIndex. The lemmas are then interned into their stable ids, which
+                     are kept in the matrix, and the rows are ordered with the ranks of the index instead of
+                     sorting the strings.
+
+    Returns:
+        A FrequencyMatrix whose rows are sorted by (headword, shortDefinition) and whose columns follow the
+        order in which the works first appear.
+
+    Note:
+    - Headwords and work labels are interned into integer codes, so the aggregation is a single sparse sum.
+    - Rows with a missing headword or shortDefinition are dropped, as pandas' groupby does.
+    """
+
+    work_codes, work_labels = pd.factorize(pd.Index(works, dtype=object))
+
+    tables = []
+    for frame in frames:
+        table = frame.iloc[:, :3].copy()
+        table.columns = LEMMA_COLUMNS + ["frequency"]
+        tables.append(table)
+
+    if tables:
+        merged = pd.concat(tables, ignore_index=True)
+    else:
+        merged = pd.DataFrame(columns=LEMMA_COLUMNS + ["frequency"])
+    columns = np.repeat(work_codes, [len(table) for table in tables])
+
+    # Drop rows with an incomplete key
+    valid = merged[LEMMA_COLUMNS].notna().all(axis=1).to_numpy()
+    merged = merged[valid]
+    columns = columns[valid]
+
+    # Intern the lemmas into row codes
+    if lemma_index is not None:
+        rows, lemma_ids = lemma_index.factorize(lemma_index.intern(merged[LEMMA_COLUMNS]))
+        lemmas = lemma_index.lemmas(lemma_ids)
+    else:
+        rows, lemma_keys = pd.MultiIndex.from_frame(merged[LEMMA_COLUMNS]).factorize(sort=True)
+        lemmas, lemma_ids = lemma_keys.to_frame(index=False, name=LEMMA_COLUMNS), None
+    values = pd.to_numeric(merged["frequency"], errors="coerce").fillna(0).to_numpy()
+
+    # Duplicated (row, column) pairs are summed when converting to the compressed form
+    counts = sparse.coo_matrix((values, (rows, columns)), shape=(len(lemmas), len(work_labels))).tocsc()
+    counts.sum_duplicates()
+
+    return FrequencyMatrix(lemmas, list(work_labels), counts, lemma_ids)
+
+
+def group_indicator(works, groups, dtype=np.float64):
+    """
+    Returns the (group labels, indicator matrix) of a grouping of `works`.
+
+    The indicator has one row per work and one column per group, sorted, with a 1 where the work belongs to the
+    group, so that counts @ indicator sums the columns of the works of every group.
+
+    Args:
+        works: List with the label of each work, in column order.
+        groups: Dict mapping work labels to their group. Works missing from it belong to no group.
+    """
+
+    labels = sorted({groups[work] for work in works if work in groups})
+    positions = {label: i for i, label in enumerate(labels)}
+    rows = [i for i, work in enumerate(works) if work in groups]
+    columns = [positions[groups[works[i]]] for i in rows]
+    indicator = sparse.csc_matrix((np.ones(len(rows), dtype=dtype), (rows, columns)), shape=(len(works), len(labels)))
+    return labels, indicator
+
+
+def load_frequency_matrix(directory, mmap_mode=None):
+    """
+    Loads a matrix saved by FrequencyMatrix.save.
+
+    Args:
+        directory: Directory written by FrequencyMatrix.save.
+        mmap_mode: Passed to numpy.load; "r" maps the arrays from disk instead of reading them into memory.
+
+    Returns:
+        A (FrequencyMatrix, metadata dict) tuple.
+    """
+
+    with open(os.path.join(directory, "dictionary.json"), "r", encoding="utf-8") as file:
+        dictionary = json.load(file)
+
+    data, indices, indptr = (np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+                             for name in MATRIX_ARRAYS)
+    counts = sparse.csc_matrix((data, indices, indptr), shape=tuple(dictionary["shape"]), copy=False)
+    lemmas = pd.DataFrame({"headword": dictionary["headwords"], "shortDefinition": dictionary["shortDefinitions"]},
+                          dtype=object)
+    lemma_ids_file = os.path.join(directory, LEMMA_IDS_FILE)
+    lemma_ids = np.load(lemma_ids_file) if os.path.isfile(lemma_ids_file) else None
+    return FrequencyMatrix(lemmas, dictionary["works"], counts, lemma_ids), dictionary["metadata"]
+
+
+def is_frequency_matrix(directory):
+    return os.path.isfile(os.path.join(directory, "dictionary.json"))
+
+
+def combine_frequency_matrices(matrices, lemma_index=None):
+    """
+    Puts side by side matrices built from disjoint sets of works, aligning their lemmas.
+
+    When `lemma_index` is given and every matrix has lemma ids from it, the lemmas are aligned on the integer ids.
+
+    Returns:
+        A FrequencyMatrix with the union of the lemmas, sorted by (headword, shortDefinition), and the works of
+        every matrix in the given order.
+    """
+
+    if lemma_index is not None and matrices and all(matrix.lemma_ids is not None for matrix in matrices):
+        codes, lemma_ids = lemma_index.factorize(np.concatenate([matrix.lemma_ids for matrix in matrices]))
+        unique_lemmas = lemma_index.lemmas(lemma_ids)
+    else:
+        lemmas = pd.concat([matrix.lemmas for matrix in matrices], ignore_index=True)
+        codes, lemma_keys = pd.MultiIndex.from_frame(lemmas[LEMMA_COLUMNS]).factorize(sort=True)
+        unique_lemmas, lemma_ids = lemma_keys.to_frame(index=False, name=LEMMA_COLUMNS), None
+
+    parts = []
+    row_offset = 0
+    for matrix in matrices:
+        # Map the rows of this matrix onto the shared lemma rows
+        row_map = codes[row_offset:row_offset + matrix.shape[0]]
+        row_offset += matrix.shape[0]
+        parts.append(sparse.csc_matrix((matrix.counts.data, row_map[matrix.counts.indices], matrix.counts.indptr),
+                                       shape=(len(unique_lemmas), matrix.shape[1])))
+
+    counts = sparse.hstack(parts, format="csc") if parts else sparse.csc_matrix((0, 0))
+    works = [work for matrix in matrices for work in matrix.works]
+    return FrequencyMatrix(unique_lemmas, works, counts, lemma_ids)
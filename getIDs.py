@@ -1,14 +1,21 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import urllib.parse
 import csv
+import json
+import os
 import re
 
+CATALOGUE_URL = 'http://www.perseus.tufts.edu/hopper/collection%3Fcollection%3DPerseus:collection:Greco-Roman'
 
-def get_perseus_work_info_trResults():
+
+def get_perseus_work_info_trResults(html=None):
     """
     Scrapes Perseus Digital Library to retrieve work information from the table rows with class "trResults".
 
+    Args:
+        html: Content of the collection page. When None, the page is downloaded.
+
     Returns:
         A list of tuples containing the extracted work information.
 
@@ -25,9 +32,9 @@ def get_perseus_work_info_trResults():
     - The extracted work information is returned as a list of tuples.
     """
 
-    url = 'http://www.perseus.tufts.edu/hopper/collection%3Fcollection%3DPerseus:collection:Greco-Roman'
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    if html is None:
+        html = requests.get(CATALOGUE_URL).text
+    soup = BeautifulSoup(html, 'html.parser')
 
     work_info = []
 
@@ -87,10 +94,13 @@ def save_work_info_to_csv(work_info):
     print("Work information saved to workInfo.csv file.")
 
 
-def get_perseus_work_info_trHiddenResults():
+def get_perseus_work_info_trHiddenResults(html=None):
     """
     Retrieves work information from the Perseus website for table rows with class "trHiddenResults".
 
+    Args:
+        html: Content of the collection page. When None, the page is downloaded.
+
     Returns:
         A list of tuples containing the work information in the format (language, author, title, work_id).
 
@@ -102,9 +112,9 @@ def get_perseus_work_info_trHiddenResults():
     - The work information is returned as a list of tuples.
     """
 
-    url = 'http://www.perseus.tufts.edu/hopper/collection%3Fcollection%3DPerseus:collection:Greco-Roman'
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    if html is None:
+        html = requests.get(CATALOGUE_URL).text
+    soup = BeautifulSoup(html, 'html.parser')
 
     work_info = []
 
@@ -140,10 +150,145 @@ def get_perseus_work_info_trHiddenResults():
     return work_info
 
 
-def get_perseus_work_info():
+def fetch_catalogue_page(url=CATALOGUE_URL, cache_file='catalogue.html', timeout=60):
+    """
+    Downloads the collection page, keeping a copy on disk that is revalidated with a conditional request.
+
+    Args:
+        url: URL of the collection page.
+        cache_file: Where the page is cached. Its ETag and Last-Modified headers are kept in cache_file + '.json'.
+                    None disables the cache.
+        timeout: Seconds to wait for the server.
+
+    Returns:
+        The HTML of the page.
+
+    Note:
+    - When the server answers 304 Not Modified, the cached copy is returned without downloading the page again.
+    - The cached copy is written to a temporary file first, so an interrupted download never replaces it.
+    """
+
+    headers = {}
+    validators = {}
+    if cache_file and os.path.isfile(cache_file) and os.path.isfile(cache_file + '.json'):
+        with open(cache_file + '.json', 'r', encoding='utf-8') as file:
+            validators = json.load(file)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    response = requests.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and headers:
+        print(f'Catalogue page not modified, using {cache_file}.')
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            return file.read()
+    response.raise_for_status()
+
+    if cache_file:
+        with open(cache_file + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(response.text)
+        os.replace(cache_file + '.tmp', cache_file)
+        with open(cache_file + '.json', 'w', encoding='utf-8') as file:
+            json.dump({'etag': response.headers.get('ETag'),
+                       'last_modified': response.headers.get('Last-Modified')}, file)
+
+    return response.text
+
+
+def get_html_parser():
+    """
+    Returns the fastest BeautifulSoup parser available: 'lxml' when it is installed, 'html.parser' otherwise.
+    """
+
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return 'html.parser'
+    return 'lxml'
+
+
+def iter_catalogue(html, parser=None):
+    """
+    Yields the work information of the "trResults" and "trHiddenResults" rows of the collection page, in page order,
+    as each row is extracted.
+
+    Args:
+        html: Content of the collection page.
+        parser: BeautifulSoup parser to use. None picks the one returned by get_html_parser().
+
+    Yields:
+        (hidden, work info) pairs, where hidden tells whether the row is a "trHiddenResults" row and work info is a
+        (language, author, title, work_id) tuple.
+
+    Note:
+    - The page is parsed once, and only its <tr> elements are turned into a tree.
+    - The author of a hidden row is read from its id attribute instead of searching the row's markup.
+    """
+
+    soup = BeautifulSoup(html, parser or get_html_parser(), parse_only=SoupStrainer('tr'))
+
+    for row in soup.find_all('tr', class_=['trResults', 'trHiddenResults']):
+        # Extract the link, language, author, and title from the row if available
+        link = row.find('a', class_='aResultsHeader')
+        if not link:
+            continue
+
+        hidden = 'trHiddenResults' in row.get('class', [])
+        if hidden:
+            # The author is the first id attribute of the row, without numbers and commas followed by a number
+            id_elem = row if row.has_attr('id') else row.find(id=True)
+            author = re.sub(r'\b\d+\b|,\d+', '', id_elem['id'] if id_elem else '')
+        else:
+            author_elem = row.find('td', class_='tdAuthor')
+            if not author_elem:
+                continue
+            author = author_elem.text.strip().split('\n')[0]
+
+        work_id = urllib.parse.unquote(link.get('href').split('doc=')[1])
+        title = link.text.strip()
+
+        # Find the next line after the link to determine the language
+        language_elem = link.find_next_sibling(string=True)
+        language_match = re.search(r'(Greek|Latin|English)', language_elem) if language_elem else None
+        language = language_match.group() if language_match else ''
+
+        yield hidden, (language, author, title, work_id)
+
+
+def parse_catalogue(html, parser=None):
+    """
+    Extracts the work information of both the "trResults" and the "trHiddenResults" rows of the collection page.
+
+    Args:
+        html: Content of the collection page.
+        parser: BeautifulSoup parser to use. None picks the one returned by get_html_parser().
+
+    Returns:
+        A list of tuples in the format (language, author, title, work_id): first the "trResults" rows, then the
+        "trHiddenResults" rows, as returned by the two get_perseus_work_info_* methods.
+
+    Note:
+    - Both row classes are collected in a single traversal of the rows, see iter_catalogue.
+    """
+
+    results = []
+    hidden_results = []
+
+    for hidden, info in iter_catalogue(html, parser):
+        (hidden_results if hidden else results).append(info)
+
+    return results + hidden_results
+
+
+def get_perseus_work_info(cache_file='catalogue.html', parser=None):
     """
     Retrieves work information from the Perseus website for both table rows with class "trResults" and "trHiddenResults"
 
+    Args:
+        cache_file: Where the collection page is cached between runs, see fetch_catalogue_page. None disables it.
+        parser: BeautifulSoup parser to use, see parse_catalogue.
+
     Returns:
         A list of tuples containing the work information in the format (language, author, title, work_id).
 
@@ -151,13 +296,11 @@ def get_perseus_work_info():
     on the Perseus website and returns the merged result.
 
     Note:
-    - The method calls the helper methods get_perseus_work_info_trResults() and get_perseus_work_info_trHiddenResults().
+    - The collection page is downloaded and parsed only once for both row classes.
     - The work information is returned as a list of tuples.
     """
 
-    temp_work_info = get_perseus_work_info_trResults()
-    temp_work_info += get_perseus_work_info_trHiddenResults()
-    return temp_work_info
+    return parse_catalogue(fetch_catalogue_page(cache_file=cache_file), parser)
 
 
 def split_work_info_file(input_file, output_file_gr, output_file_lat):
@@ -0,0 +1,160 @@
+import contextlib
+import datetime
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def io_counters():
+    """
+    Returns the (bytes read, bytes written) of the current process so far, or (None, None) when unknown.
+
+    The counters include every read and write call, whether it hit the disk or the page cache.
+    """
+
+    if os.path.isfile('/proc/self/io'):
+        counters = {}
+        with open('/proc/self/io', 'r') as file:
+            for line in file:
+                name, value = line.split(':')
+                counters[name] = int(value)
+        return counters['rchar'], counters['wchar']
+
+    if psutil is not None:
+        counters = psutil.Process().io_counters()
+        return getattr(counters, 'read_chars', counters.read_bytes), getattr(counters, 'write_chars',
+                                                                            counters.write_bytes)
+
+    return None, None
+
+
+def cpu_seconds():
+    """
+    Returns the user and system CPU time of the current process and of its finished child processes.
+    """
+
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size in MB of this process and of its finished children, or None when unknown.
+    """
+
+    if resource is not None:
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024 ** 2
+
+    return None
+
+
+def beep_notifier(message):
+    """
+    Notifier that beeps like the pipeline used to, with winsound on Windows and the terminal bell elsewhere.
+    """
+
+    print(message)
+    try:
+        import winsound
+    except ImportError:
+        print('\a', end='', flush=True)
+    else:
+        winsound.Beep(800, 1000)
+
+
+def print_notifier(message):
+    print(message)
+
+
+class PipelineReport:
+    """
+    Collects wall time, CPU time, I/O, peak memory and custom counters for every stage of a pipeline run.
+
+    Stages can be nested; a nested stage is reported as "outer / inner". The report is written as JSON.
+
+    Usage:
+        report = PipelineReport(notifier=beep_notifier)
+        with report.stage("convert") as counters:
+            counters["files"] = convert(...)
+        report.notify("Conversion done")
+        report.write("pipeline report.json")
+
+    Note:
+    - Peak RSS is the high-water mark of the process when the stage ends, so it only grows from stage to stage; a
+      jump shows the stage that set a new peak.
+    - Bytes read and written cover the current process only, not the worker processes of a process pool.
+    """
+
+    def __init__(self, notifier=None):
+        self.notifier = notifier
+        self.started = datetime.datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self.path = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Measures the enclosed block as stage `name`, yielding a dict where the block can store counters such as
+        rows or files processed.
+        """
+
+        self.path.append(name)
+        counters = {}
+        start_wall = time.perf_counter()
+        start_cpu = cpu_seconds()
+        start_read, start_written = io_counters()
+
+        try:
+            yield counters
+        finally:
+            end_read, end_written = io_counters()
+            self.stages.append({
+                'stage': ' / '.join(self.path),
+                'wall_seconds': round(time.perf_counter() - start_wall, 3),
+                'cpu_seconds': round(cpu_seconds() - start_cpu, 3),
+                'bytes_read': end_read - start_read if start_read is not None else None,
+                'bytes_written': end_written - start_written if start_written is not None else None,
+                'peak_rss_mb': peak_rss_mb(),
+                **counters,
+            })
+            self.path.pop()
+
+    def notify(self, message):
+        if self.notifier is not None:
+            self.notifier(message)
+
+    def to_dict(self):
+        return {'started': self.started, 'stages': self.stages}
+
+    def write(self, output_file, history_file=None):
+        """
+        Writes the report to `output_file` and, if given, appends it as one line to `history_file`, so that runs
+        can be compared over time.
+        """
+
+        with open(output_file, 'w', encoding='utf-8') as file:
+            json.dump(self.to_dict(), file, indent=1, ensure_ascii=False)
+
+        if history_file:
+            with open(history_file, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(self.to_dict(), ensure_ascii=False) + '\n')
+
+        print(f'Pipeline report written to {output_file}.')
@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+LEMMA_COLUMNS = ["headword", "shortDefinition"]
+
+
+class LemmaIndex:
+    """
+    Persistent dictionary giving every lemma, identified by (headword, shortDefinition), a stable integer id.
+
+    Ids are assigned in order of first appearance and never change: new lemmas are appended at the end, so a
+    rerun on more works keeps the ids of the lemmas already known. Once the lemmas of a table are interned, joins,
+    group-bys and sorts can work on the integer ids instead of hashing and comparing the strings again.
+
+    The lemmas are stored in `path` as a CSV file in id order, and the number of lemmas and a unique identifier of
+    the index in `path` + ".json". The identifier changes when the index is recreated from scratch, so that data
+    keyed by the ids of another index can be recognised.
+
+    Usage:
+        index = LemmaIndex("lemma index.csv")
+        ids = index.intern(frame[["headword", "shortDefinition"]])
+        index.save()
+
+    Attributes:
+        path: Path of the CSV file.
+        uid: Identifier of this index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.uid = uuid.uuid4().hex
+        self.headwords = []
+        self.short_definitions = []
+        self.saved = 0
+
+        if os.path.isfile(path + ".json") and os.path.isfile(path):
+            with open(path + ".json", "r", encoding="utf-8") as file:
+                description = json.load(file)
+            lemmas = pd.read_csv(path, dtype=str, keep_default_na=False)
+            self.uid = description["uid"]
+            # Rows appended by a save that did not complete are dropped, and rewritten by the next save
+            self.headwords = lemmas["headword"].tolist()[:description["count"]]
+            self.short_definitions = lemmas["shortDefinition"].tolist()[:description["count"]]
+            self.saved = len(self.headwords) if len(lemmas) == description["count"] else 0
+
+        self.keys = pd.MultiIndex.from_arrays([self.headwords, self.short_definitions], names=LEMMA_COLUMNS)
+        self.ranks = None
+
+    def __len__(self):
+        return len(self.headwords)
+
+    def lookup(self, lemmas):
+        """
+        Returns the ids of the rows of the DataFrame `lemmas` (headword, shortDefinition), -1 for unknown lemmas.
+        """
+
+        keys = pd.MultiIndex.from_frame(lemmas.iloc[:, 0:2], names=LEMMA_COLUMNS)
+        return self.keys.get_indexer(keys)
+
+    def intern(self, lemmas):
+        """
+        Returns the ids of the rows of the DataFrame `lemmas` (headword, shortDefinition), adding the unknown lemmas
+        to the index. The rows must not have missing values.
+        """
+
+        ids = self.lookup(lemmas)
+        unknown = ids < 0
+        if unknown.any():
+            new_lemmas = lemmas.iloc[unknown, 0:2].drop_duplicates()
+            self.headwords.extend(new_lemmas.iloc[:, 0].tolist())
+            self.short_definitions.extend(new_lemmas.iloc[:, 1].tolist())
+            self.keys = pd.MultiIndex.from_arrays([self.headwords, self.short_definitions], names=LEMMA_COLUMNS)
+            self.ranks = None
+            ids[unknown] = self.keys.get_indexer(pd.MultiIndex.from_frame(lemmas.iloc[unknown, 0:2],
+                                                                          names=LEMMA_COLUMNS))
+        return ids
+
+    def intern_files(self, csv_files, batch_size=256):
+        """
+        Interns the lemmas of frequency CSV files, as written by xmlToCsv.
+
+        The files are interned `batch_size` at a time, so the index is extended once per batch rather than once
+        per file.
+        """
+
+        csv_files = list(csv_files)
+        for start in range(0, len(csv_files), batch_size):
+            lemmas = pd.concat([pd.read_csv(csv_file, usecols=LEMMA_COLUMNS, dtype=str)
+                                for csv_file in csv_files[start:start + batch_size]], ignore_index=True)
+            self.intern(lemmas.dropna())
+
+    def lemmas(self, ids):
+        """
+        Returns the DataFrame of the headword and shortDefinition of `ids`.
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        return pd.DataFrame({"headword": np.asarray(self.headwords, dtype=object)[ids],
+                             "shortDefinition": np.asarray(self.short_definitions, dtype=object)[ids]})
+
+    def rank(self, ids):
+        """
+        Returns the position of `ids` in the order of (headword, shortDefinition), the order of the merged tables.
+        """
+
+        if self.ranks is None:
+            # Sorting the strings once per version of the index replaces sorting them in every merge
+            order = np.lexsort((np.asarray(self.short_definitions, dtype=object),
+                                np.asarray(self.headwords, dtype=object)))
+            self.ranks = np.empty(len(order), dtype=np.int64)
+            self.ranks[order] = np.arange(len(order))
+        return self.ranks[np.asarray(ids, dtype=np.int64)]
+
+    def factorize(self, ids):
+        """
+        Numbers the distinct `ids` in (headword, shortDefinition) order.
+
+        Returns:
+            A (codes, lemma ids) tuple: `codes` gives for every element of `ids` its row among the distinct lemmas,
+            and `lemma ids` the id of every row, sorted like the lemmas are in the merged tables.
+        """
+
+        unique_ids, codes = np.unique(np.asarray(ids, dtype=np.int64), return_inverse=True)
+        order = np.argsort(self.rank(unique_ids), kind="stable")
+        rows = np.empty(len(order), dtype=np.int64)
+        rows[order] = np.arange(len(order))
+        return rows[codes.ravel()], unique_ids[order]
+
+    def save(self):
+        """
+        Appends the lemmas added since the last save to the CSV file, then records the new count.
+        """
+
+        if self.saved == 0 or not os.path.isfile(self.path):
+            with open(self.path, "w", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerow(LEMMA_COLUMNS)
+            self.saved = 0
+
+        with open(self.path, "a", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerows(zip(self.headwords[self.saved:], self.short_definitions[self.saved:]))
+
+        temp_file = self.path + ".json.tmp"
+        with open(temp_file, "w", encoding="utf-8") as file:
+            json.dump({"uid": self.uid, "count": len(self)}, file)
+        os.replace(temp_file, self.path + ".json")
+        self.saved = len(self)
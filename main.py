@@ -1,119 +1,365 @@
 import getIDs
 import xmlToCsv
 import xmlDownloader
+import xmlStorage
 import removeUselessData
 import csvAnalysis
-import winsound
+import frequencyMatrix
+import matrixStore
+import stageCache
+import instrumentation
+import lemmaIndex
+import streamingPipeline
 import os
+import shutil
 
+# Files written by create_Dataset
+DATASET_FILES = ["- dictionary.csv", "- all freq no dict.csv", "- all perc.csv", "- similarity matrix.csv",
+                 "- similarity matrix - headers.csv"]
 
-def run_all(work_directory, delete_files=False):
-    # STEP 1: DOWNLOAD THE LIST OF WORKS WITH THE IDs FROM THE WEBSITE AND SAVE THE RESULT
+# Written by create_Dataset instead of the similarity matrix when only the nearest works are wanted
+NEAREST_WORKS_FILE = "- nearest works.csv"
 
-    work_info = getIDs.get_perseus_work_info()
+# Weighted matrix written by create_Dataset for every weighting mode, see weighting.weight_matrix
+WEIGHTED_FILES = {"relative": "- all perc.csv", "tfidf": "- all tfidf.csv", "log": "- all log.csv"}
 
-    getIDs.save_work_info_to_csv(work_info)
+# Binary lemma x work matrix handed from the merge to the dataset stage, and the cache of the incremental merge
+MATRIX_DIRECTORY = frequencyMatrix.MATRIX_DIRECTORY
+MERGE_CACHE = "- merge cache"
 
-    getIDs.split_work_info_file('workInfo.csv', 'work_info_gr.csv', 'work_info_lat.csv')
+# Similarity matrix kept by create_Dataset between runs, so that only the works added or changed are compared again
+SIMILARITY_STORE = "- similarity store.bin"
 
-    # delete the useless file that contains the list of IDs not split
-    os.remove('workInfo.csv')
 
-    work_directory = os.path.join(work_directory, "classicalTextFrequencies")
+def stage_counters(result):
+    # Turn what a stage function returned into counters for the pipeline report
+    if isinstance(result, dict):
+        return result
+    if isinstance(result, frequencyMatrix.FrequencyMatrix):
+        return {"lemmas": result.shape[0], "works": result.shape[1]}
+    return {}
 
-    xmlDownloader.delete_small_xml_files(work_directory)
 
-    # create all .csv files
-    xmlDownloader.fetch_text_frequencies("work_info_lat.csv", "latin", work_directory)
-    xmlDownloader.fetch_text_frequencies("work_info_gr.csv", "greek", work_directory)
-    xmlDownloader.delete_small_xml_files(work_directory)
-    xmlDownloader.delete_empty_folders(work_directory)
+def dataset_files(weighting="relative", nearest_works=None):
+    files = [WEIGHTED_FILES[weighting] if name == "- all perc.csv" else name for name in DATASET_FILES]
+    if nearest_works:
+        files = [name for name in files if not name.startswith("- similarity matrix")] + [NEAREST_WORKS_FILE]
+    return files
 
-    # delete the id for Greek and Latin
-    if delete_files:
-        os.remove("work_info_lat.csv")
-        os.remove("work_info_gr.csv")
 
-    # STEP 2: CREATE THE .CSV FILES
+def download_stage(work_info_file, lang, work_directory, **download_options):
+    """
+    Returns the arguments of StageManifest.run for the download of the works of `lang`, see run_all.
+
+    Invalid responses are never saved, and the works that failed are listed in the failed works file of the language,
+    see xmlDownloader.fetch_text_frequencies. While that file exists the stage is forced, so every run retries the
+    missing works; the stored files are skipped, so such a run only requests those works.
+
+    Args:
+        download_options: Passed to xmlDownloader.fetch_text_frequencies, e.g. base_url.
+    """
+
+    lang_directory = os.path.join(work_directory, lang)
+    return {
+        "inputs": [work_info_file],
+        "outputs": lambda: stageCache.list_files(lang_directory, xmlStorage.XML_SUFFIXES),
+        "function": lambda: xmlDownloader.fetch_text_frequencies(work_info_file, lang, work_directory,
+                                                                 **download_options),
+        "force": os.path.isfile(xmlDownloader.failed_works_file(work_directory, lang)),
+    }
+
 
-    xmlToCsv.convert_directory_xml_to_csv(work_directory)
+def scrape_catalogue():
+    # Writes the work information of the catalogue into work_info_gr.csv and work_info_lat.csv
+    work_info = getIDs.get_perseus_work_info()
 
-    work_directory_gr = os.path.join(work_directory, "greek")
-    work_directory_lat = os.path.join(work_directory, "latin")
+    getIDs.save_work_info_to_csv(work_info)
 
-    removeUselessData.eliminate_words(work_directory_gr, "gr - wordsToEliminate.csv")
+    getIDs.split_work_info_file('workInfo.csv', 'work_info_gr.csv', 'work_info_lat.csv')
 
-    output_directory_gr = os.path.join(work_directory, "greek output")
-    output_directory_lat = os.path.join(work_directory, "latin output")
-    os.makedirs(output_directory_gr, exist_ok=True)
-    os.makedirs(output_directory_lat, exist_ok=True)
+    # delete the useless file that contains the list of IDs not split
+    os.remove('workInfo.csv')
 
-    output_directory_gr_auth = os.path.join(output_directory_gr, "By Author")
-    output_directory_gr_filt = os.path.join(output_directory_gr, "All Works - Filtered")
-    output_directory_gr_pure = os.path.join(output_directory_gr, "All Works - pure")
-    output_directory_lat_pure = os.path.join(output_directory_lat, "All works")
+    return {"works": len(work_info)}
 
-    try:
-        os.makedirs(output_directory_gr_auth, exist_ok=True)
-    except:
-        pass
 
-    try:
-        os.makedirs(output_directory_gr_filt, exist_ok=True)
-    except:
-        pass
+def streaming_download_stage(work_info_files, work_directory, **stream_options):
+    """
+    Returns the arguments of StageManifest.run for the download of the works of `work_info_files`, a dict mapping
+    every language to its work info file, overlapped with their conversion, see streamingPipeline.stream_works_to_csv.
 
-    try:
-        os.makedirs(output_directory_gr_pure, exist_ok=True)
-    except:
-        pass
+    As for download_stage, the stage is forced while a language has a failed works file.
 
-    try:
-        os.makedirs(output_directory_lat_pure, exist_ok=True)
-    except:
-        pass
+    Args:
+        stream_options: Passed to streamingPipeline.stream_works_to_csv, e.g. manifest and lemma_index.
+    """
 
-    csvAnalysis.merge_all_by_author(work_directory_gr, output_directory_gr_auth)
-    csvAnalysis.delete_files_with_pattern(work_directory_gr)
+    return {
+        "inputs": list(work_info_files.values()),
+        "outputs": lambda: [file for lang in work_info_files
+                            for file in stageCache.list_files(os.path.join(work_directory, lang),
+                                                              xmlStorage.XML_SUFFIXES)],
+        "function": lambda: streamingPipeline.stream_works_to_csv(work_info_files, work_directory, **stream_options),
+        "force": any(os.path.isfile(xmlDownloader.failed_works_file(work_directory, lang))
+                     for lang in work_info_files),
+    }
 
-    winsound.Beep(800, 1000)
 
-    csvAnalysis.merge_csv_files(work_directory_gr, os.path.join(output_directory_gr_filt, "- all freq.csv"))
-    csvAnalysis.delete_files_with_pattern(work_directory_gr, "- cleaned.csv")
+def run_all(work_directory, delete_files=False, refresh_catalogue=False, notifier=None, streaming_merge=False,
+            weighting="relative", streaming_download=False, nearest_works=None, groupings=None):
+    # streaming_merge=True merges with bounded memory (see streamingMerge), for corpora larger than the RAM.
+    # weighting selects how the counts are weighted before the similarity: "relative", "tfidf" or "log"
+    # streaming_download=True overlaps the downloads and the conversion, see streamingPipeline
+    # nearest_works=k writes the k nearest works of every work, found approximately, instead of the similarity matrix
+    # groupings maps a name to a CSV file grouping the works (see csvAnalysis.read_groups),
+    # e.g. {"Genre": "genres.csv"}; every language then gets a "By <name>" dataset summed from the per-work matrix.
+    # It needs that matrix in memory, so it cannot be combined with streaming_merge
+    if groupings and streaming_merge:
+        # The groupings are summed from the per-work matrix, which the streaming merge never holds in memory
+        raise ValueError("groupings cannot be combined with streaming_merge")
 
-    winsound.Beep(800, 1000)
+    work_directory = os.path.join(work_directory, "classicalTextFrequencies")
+    os.makedirs(work_directory, exist_ok=True)
 
-    removeUselessData.clean_columns_but_keep_all_data(work_directory_gr)
-    csvAnalysis.merge_all_csv_files(work_directory_gr, os.path.join(output_directory_gr_pure, "- all freq.csv"))
+    # Every stage is recorded in the manifest, so that a rerun only recomputes what changed
+    manifest = stageCache.StageManifest(os.path.join(work_directory, "stage manifest.json"))
 
-    winsound.Beep(800, 1000)
+    # Every lemma gets a stable integer id at conversion time, which the merges and the datasets then use
+    lemma_index = lemmaIndex.LemmaIndex(os.path.join(work_directory, "lemma index.csv"))
 
-    removeUselessData.clean_columns_but_keep_all_data(work_directory_lat)
-    csvAnalysis.merge_all_csv_files(work_directory_lat, os.path.join(output_directory_lat_pure, "- all freq.csv"))
+    # Every stage is also measured; pass e.g. instrumentation.beep_notifier to be told when the long stages end
+    report = instrumentation.PipelineReport(notifier)
 
-    winsound.Beep(800, 1000)
+    def run_stage(stage, inputs, outputs, function, **options):
+        with report.stage(stage) as counters:
+            results = []
+            ran = manifest.run(stage, inputs, outputs, lambda: results.append(function()), **options)
+            counters["skipped"] = not ran
+            if results:
+                counters.update(stage_counters(results[0]))
+        return ran
 
-    if delete_files:
-        os.remove(work_directory_gr)
-        os.remove(work_directory_lat)
+    # STEP 1: DOWNLOAD THE LIST OF WORKS WITH THE IDs FROM THE WEBSITE AND SAVE THE RESULT
 
-    create_Dataset(output_directory_gr_auth)
-    create_Dataset(output_directory_gr_filt)
-    create_Dataset(output_directory_gr_pure)
+    run_stage("catalogue", [], ['work_info_gr.csv', 'work_info_lat.csv'], scrape_catalogue, force=refresh_catalogue)
 
-    winsound.Beep(800, 1000)
+    if streaming_download:
+        # Works are converted as soon as they are downloaded
+        converted = run_stage("download and convert",
+                              **streaming_download_stage({"latin": "work_info_lat.csv", "greek": "work_info_gr.csv"},
+                                                         work_directory, manifest=manifest, lemma_index=lemma_index))
+    else:
+        # create all .xml files
+        def download(work_info_file, lang):
+            run_stage(f"download {lang}", **download_stage(work_info_file, lang, work_directory))
 
+        download("work_info_lat.csv", "latin")
+        download("work_info_gr.csv", "greek")
+        converted = False
 
-def create_Dataset(directory):
-    csvAnalysis.add_progressive_numbering(os.path.join(directory, "- all freq.csv"),
-                                          os.path.join(directory, "- dictionary.csv"),
-                                          os.path.join(directory, "- all freq no dict.csv"))
+    # STEP 2: CREATE THE .CSV FILES
+
+    # A streamed download converts its files itself; when it is up to date, the CSV files are checked as usual
+    if not converted:
+        with report.stage("convert") as counters:
+            counters.update(xmlToCsv.convert_directory_xml_to_csv(work_directory, manifest=manifest,
+                                                                   lemma_index=lemma_index))
+
+    # delete the id for Greek and Latin
+    if delete_files:
+        os.remove("work_info_lat.csv")
+        os.remove("work_info_gr.csv")
 
-    csvAnalysis.calculate_percentages(os.path.join(directory, "- all freq no dict.csv"),
-                                      os.path.join(directory, "- all perc.csv"))
+    # STEP 3: CLEAN AND MERGE THE WORKS OF EVERY LANGUAGE
+
+    def clean_and_merge(lang, output_directory, pure_directory_name):
+        lang_directory = os.path.join(work_directory, lang)
+        profile = removeUselessData.PROFILES[lang]
+
+        output_directory_auth = os.path.join(output_directory, "By Author")
+        output_directory_filt = os.path.join(output_directory, "All Works - Filtered")
+        output_directory_pure = os.path.join(output_directory, pure_directory_name)
+        for directory in (output_directory_auth, output_directory_filt, output_directory_pure):
+            os.makedirs(directory, exist_ok=True)
+
+        run_stage(f"clean {lang}",
+                  stageCache.list_files(lang_directory, "Pure freq.csv") + [profile.words_file],
+                  lambda: stageCache.list_files(lang_directory, "- cleaned.csv"),
+                  lambda: removeUselessData.clean_directory(lang_directory, profile, "- cleaned.csv"),
+                  params={"match": "canonical key, grave as acute"})
+
+        # The cleaned files are kept, so that the next run can merge them incrementally
+        output_file_filt = os.path.join(output_directory_filt, "- all freq.csv")
+        run_stage(f"merge {lang} filtered", stageCache.list_files(lang_directory, "- cleaned.csv"),
+                  [output_file_filt],
+                  lambda: csvAnalysis.merge_csv_files(lang_directory, output_file_filt,
+                                                      cache_directory=os.path.join(output_directory_filt, MERGE_CACHE),
+                                                      matrix_directory=os.path.join(output_directory_filt,
+                                                                                    MATRIX_DIRECTORY),
+                                                      streaming=streaming_merge, lemma_index=lemma_index))
+
+        report.notify(f"Filtered {lang.capitalize()} works merged.")
+
+        # The merge cache of the filtered works is the per-work matrix with every lemma, so the authors and any
+        # other grouping are summed from it instead of reading the cleaned files again
+        merge_cache = os.path.join(output_directory_filt, MERGE_CACHE)
+
+        def per_work_matrix():
+            # Only the works whose files changed since the cache was written are read again
+            return csvAnalysis.update_frequency_matrix(csvAnalysis.find_frequency_files(lang_directory),
+                                                       merge_cache, lemma_index)
+
+        def merge_by_author():
+            matrix_directory = os.path.join(output_directory_auth, MATRIX_DIRECTORY)
+            if streaming_merge:
+                # Bounded memory: merge the files out of core, and let the dataset stage read the CSV
+                if os.path.isdir(matrix_directory):
+                    shutil.rmtree(matrix_directory)
+                csvAnalysis.merge_all_by_author(lang_directory, output_directory_auth, streaming=True,
+                                                lemma_index=lemma_index)
+                csvAnalysis.delete_files_with_pattern(lang_directory)
+                return None
+            authors = csvAnalysis.author_groups(lang_directory)
+            # Every column is an author, which is its own author for corpusIndex
+            return csvAnalysis.merge_by_group(per_work_matrix(), authors,
+                                              os.path.join(output_directory_auth, "- all freq.csv"), matrix_directory,
+                                              {"authors": {author: author for author in set(authors.values())}})
+
+        run_stage(f"merge {lang} by author", stageCache.list_files(lang_directory, "- cleaned.csv"),
+                  [os.path.join(output_directory_auth, "- all freq.csv")], merge_by_author,
+                  params={"source": "per-work matrix"})
+
+        report.notify(f"{lang.capitalize()} works merged by author.")
+
+        def merge_by_group(groups_file, output_directory_group):
+            return csvAnalysis.merge_by_group(per_work_matrix(), csvAnalysis.read_groups(groups_file),
+                                              os.path.join(output_directory_group, "- all freq.csv"),
+                                              os.path.join(output_directory_group, MATRIX_DIRECTORY))
+
+        output_directories_groups = []
+        for name, groups_file in (groupings or {}).items():
+            # A grouping of the works of the other language gives no dataset
+            works = {work for _, work in csvAnalysis.find_frequency_files(lang_directory)}
+            if not works & set(csvAnalysis.read_groups(groups_file)):
+                print(f"No {lang} work in {groups_file}.")
+                continue
+
+            output_directory_group = os.path.join(output_directory, f"By {name}")
+            os.makedirs(output_directory_group, exist_ok=True)
+            run_stage(f"merge {lang} by {name.lower()}",
+                      stageCache.list_files(lang_directory, "- cleaned.csv") + [groups_file],
+                      [os.path.join(output_directory_group, "- all freq.csv")],
+                      lambda file=groups_file, directory=output_directory_group: merge_by_group(file, directory))
+            output_directories_groups.append(output_directory_group)
+            report.notify(f"{lang.capitalize()} works grouped by {name.lower()}.")
+
+        output_file_pure = os.path.join(output_directory_pure, "- all freq.csv")
+        run_stage(f"clean {lang} pure", stageCache.list_files(lang_directory, "Pure freq.csv"),
+                  lambda: stageCache.list_files(lang_directory, "- pure.csv"),
+                  lambda: removeUselessData.clean_columns_but_keep_all_data(lang_directory, "- pure.csv", profile))
+
+        run_stage(f"merge {lang} pure", stageCache.list_files(lang_directory, "- pure.csv"), [output_file_pure],
+                  lambda: csvAnalysis.merge_all_csv_files(lang_directory, output_file_pure, pattern="- pure.csv",
+                                                          cache_directory=os.path.join(output_directory_pure,
+                                                                                       MERGE_CACHE),
+                                                          matrix_directory=os.path.join(output_directory_pure,
+                                                                                        MATRIX_DIRECTORY),
+                                                          streaming=streaming_merge,
+                                                          lemma_index=lemma_index))
+
+        report.notify(f"All {lang} works merged.")
+        return [output_directory_auth] + output_directories_groups + [output_directory_filt, output_directory_pure]
+
+    output_directories = (clean_and_merge("greek", os.path.join(work_directory, "greek output"), "All Works - pure")
+                          + clean_and_merge("latin", os.path.join(work_directory, "latin output"), "All works"))
 
-    csvAnalysis.calculate_similarity_matrix(os.path.join(directory, "- all perc.csv"),
-                                            os.path.join(directory, "- similarity matrix.csv"))
+    if delete_files:
+        os.remove(os.path.join(work_directory, "greek"))
+        os.remove(os.path.join(work_directory, "latin"))
+
+    for directory in output_directories:
+        run_stage(f"dataset {os.path.relpath(directory, work_directory)}",
+                  [os.path.join(directory, "- all freq.csv")]
+                  + stageCache.list_files(os.path.join(directory, MATRIX_DIRECTORY)),
+                  [os.path.join(directory, name) for name in dataset_files(weighting, nearest_works)],
+                  lambda directory=directory: create_Dataset(directory, report, weighting, nearest_works),
+                  params=dict({"weighting": weighting}, **({"nearest_works": nearest_works} if nearest_works else {})))
+
+    # Keep the report of every run, so that a stage that regressed can be spotted
+    report.write(os.path.join(work_directory, "pipeline report.json"),
+                 os.path.join(work_directory, "pipeline history.jsonl"))
+
+    report.notify("Pipeline completed.")
+
+
+def create_Dataset(directory, report=None, weighting="relative", nearest_works=None):
+    # Without a report from run_all, the dataset gets a report of its own
+    standalone = report is None
+    if standalone:
+        report = instrumentation.PipelineReport()
+
+    # Use the binary matrix written by the merge when there is one, and write CSV files only as the final outputs
+    matrix_directory = os.path.join(directory, MATRIX_DIRECTORY)
+    if frequencyMatrix.is_frequency_matrix(matrix_directory):
+        matrix, _ = frequencyMatrix.load_frequency_matrix(matrix_directory, mmap_mode="r")
+
+        with report.stage("numbering") as counters:
+            csvAnalysis.add_progressive_numbering_from_matrix(matrix,
+                                                              os.path.join(directory, "- dictionary.csv"),
+                                                              os.path.join(directory, "- all freq no dict.csv"))
+            counters.update(lemmas=matrix.shape[0], works=matrix.shape[1])
+
+        # The weighted matrix goes to the similarity step in memory; its CSV file is only an output
+        with report.stage("percentages"):
+            percent_matrix = csvAnalysis.calculate_percentages_from_matrix(matrix,
+                                                                           os.path.join(directory,
+                                                                                        WEIGHTED_FILES[weighting]),
+                                                                           mode=weighting)
+
+        with report.stage("similarity"):
+            if nearest_works:
+                csvAnalysis.calculate_nearest_works_from_matrix(percent_matrix,
+                                                                os.path.join(directory, NEAREST_WORKS_FILE),
+                                                                nearest_works)
+            else:
+                csvAnalysis.calculate_similarity_matrix_from_matrix(percent_matrix,
+                                                                    os.path.join(directory,
+                                                                                 "- similarity matrix.csv"),
+                                                                    store_path=os.path.join(directory,
+                                                                                            SIMILARITY_STORE))
+    else:
+        with report.stage("numbering"):
+            csvAnalysis.add_progressive_numbering(os.path.join(directory, "- all freq.csv"),
+                                                  os.path.join(directory, "- dictionary.csv"),
+                                                  os.path.join(directory, "- all freq no dict.csv"))
+
+        # Work on memory-mapped copies of the matrices, one block of rows at a time, so that memory stays bounded
+        with report.stage("percentages") as counters:
+            count_store = matrixStore.csv_to_store(os.path.join(directory, "- all freq no dict.csv"),
+                                                   os.path.join(directory, "- all freq no dict.bin"))
+            counters.update(lemmas=count_store.shape[0], works=count_store.shape[1])
+
+            percent_store = csvAnalysis.calculate_percentages_from_store(count_store,
+                                                                         os.path.join(directory,
+                                                                                      WEIGHTED_FILES[weighting]),
+                                                                         os.path.join(directory, "- all perc.bin"),
+                                                                         mode=weighting)
+
+        with report.stage("similarity"):
+            if nearest_works:
+                csvAnalysis.calculate_nearest_works_from_store(percent_store,
+                                                               os.path.join(directory, NEAREST_WORKS_FILE),
+                                                               nearest_works)
+            else:
+                csvAnalysis.calculate_similarity_matrix_from_store(percent_store,
+                                                                   os.path.join(directory,
+                                                                                "- similarity matrix.csv"))
+
+        count_store.delete()
+        percent_store.delete()
+
+    if standalone:
+        report.write(os.path.join(directory, "- dataset report.json"))
 
 
 # USE RUN ALL
@@ -0,0 +1,92 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class MatrixStore:
+    """
+    Dense lemma x work matrix kept on disk and memory-mapped, so that it can be processed block by block.
+
+    The values are stored row-major as raw float64 in `path`, and the shape and column labels in `path` + ".json".
+    Only the blocks being worked on are paged into memory, so the size of the matrix is bounded by the disk
+    rather than by the RAM.
+
+    Attributes:
+        path: Path of the raw values file.
+        columns: List with the label of each column.
+        values: numpy.memmap of shape (rows, len(columns)).
+    """
+
+    def __init__(self, path, mode='r'):
+        with open(path + '.json', 'r', encoding='utf-8') as file:
+            description = json.load(file)
+
+        self.path = path
+        self.columns = description['columns']
+        shape = tuple(description['shape'])
+        if shape[0] == 0 or shape[1] == 0:
+            # numpy cannot map an empty file
+            self.values = np.zeros(shape)
+        else:
+            self.values = np.memmap(path, dtype=np.float64, mode=mode, shape=shape)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def iter_row_blocks(self, block_rows=10000):
+        """
+        Yields (start, stop, block) for consecutive blocks of at most `block_rows` rows.
+        """
+
+        for start in range(0, self.shape[0], block_rows):
+            stop = min(start + block_rows, self.shape[0])
+            yield start, stop, np.asarray(self.values[start:stop])
+
+    def column_sums(self, block_rows=10000):
+        sums = np.zeros(self.shape[1])
+        for _, _, block in self.iter_row_blocks(block_rows):
+            sums += block.sum(axis=0)
+        return sums
+
+    def delete(self):
+        """
+        Removes the files of the store.
+        """
+
+        del self.values
+        os.remove(self.path)
+        os.remove(self.path + '.json')
+
+
+def write_store(path, blocks, columns):
+    """
+    Writes a MatrixStore from an iterable of 2-D row blocks, appending them one after the other.
+
+    Returns:
+        The MatrixStore, opened read-only.
+    """
+
+    rows = 0
+    with open(path, 'wb') as file:
+        for block in blocks:
+            block = np.ascontiguousarray(block, dtype=np.float64)
+            file.write(block.tobytes())
+            rows += block.shape[0]
+
+    with open(path + '.json', 'w', encoding='utf-8') as file:
+        json.dump({'shape': [rows, len(columns)], 'columns': list(columns)}, file, ensure_ascii=False)
+
+    return MatrixStore(path)
+
+
+def csv_to_store(input_file, path, chunk_rows=10000):
+    """
+    Streams a numeric CSV file, like "- all freq no dict.csv", into a MatrixStore without loading it whole.
+    """
+
+    columns = pd.read_csv(input_file, nrows=0).columns.tolist()
+    chunks = pd.read_csv(input_file, chunksize=chunk_rows)
+    return write_store(path, (chunk.to_numpy(dtype=np.float64) for chunk in chunks), columns)
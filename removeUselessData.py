@@ -1,69 +1,175 @@
 import os
 import csv
-from collections import Counter
-import shutil
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import stopwordFilter
 
+# Suffixes of the files written by the cleaning functions, which must not be cleaned again
+CLEANED_SUFFIXES = ('- cleaned.csv', '- pure.csv')
+
+# Columns of the xmlToCsv files kept by the cleaning: headword, shortDefinition and weightedFrequency
+PROJECTED_COLUMNS = (0, 1, 4)
 
-def delete_lines_with_duplicate_word(input_file):
-    output_file = f"{input_file}.tmp"  # Temporary file to store filtered lines
-
-    with open(input_file, 'r', encoding='utf-8') as file:
-        reader = csv.reader(file)
-        header = next(reader)  # Read the header row
-
-        word_column_index = 0  # Assuming the word is in the first column
-        lines_to_keep = []
-        word_counts = Counter()
-
-        # Iterate over each row in the CSV file
-        for row in reader:
-            word = row[word_column_index]
-            word_counts[word] += 1
-
-            # Keep the line if it's the first occurrence of the word
-            if word_counts[word] == 1:
-                lines_to_keep.append(row)
 
-    # Write the filtered lines to the temporary file
-    with open(output_file, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
-        writer.writerows(lines_to_keep)
+class CleaningProfile:
+    """
+    How the frequency lists of one language are cleaned.
+
+    Attributes:
+        words_file: CSV file of the words to eliminate, see stopwordFilter.load_stopword_filter.
+        normalizer: Function giving the canonical key under which headwords and stopwords are matched.
+        columns: Indexes of the columns kept, in order.
+    """
+
+    def __init__(self, words_file, normalizer, columns=PROJECTED_COLUMNS):
+        self.words_file = words_file
+        self.normalizer = normalizer
+        self.columns = tuple(columns)
+
+    def stopword_filter(self, include_categories=None, exclude_categories=None):
+        return stopwordFilter.load_stopword_filter(self.words_file, include_categories, exclude_categories,
+                                                   self.normalizer)
+
+
+PROFILES = {
+    'greek': CleaningProfile('gr - wordsToEliminate.csv', stopwordFilter.normalize_beta_code),
+    'latin': CleaningProfile('lat - wordsToEliminate.csv', stopwordFilter.normalize_latin),
+}
+
+
+def clean_file(input_file, output_file, words_to_eliminate=frozenset(), chunk_rows=100000,
+               columns=PROJECTED_COLUMNS):
+    """
+    Cleans a frequency CSV in a single pass: drops the words to eliminate, keeps only the first line of every
+    word and projects the columns, by default to headword, shortDefinition and weightedFrequency.
+
+    Args:
+        input_file: CSV file as written by xmlToCsv.
+        output_file: Destination, which may be `input_file` itself.
+        words_to_eliminate: stopwordFilter.StopwordFilter, or set of words whose lines are dropped by exact match.
+        chunk_rows: Number of lines read and filtered at a time.
+        columns: Indexes of the columns kept, in order.
+
+    Note:
+    - This is equivalent to filtering the words out, removing the lines of repeated words and then dropping the
+      columns, but reads and writes the file only once.
+    - The words to eliminate are matched over a whole chunk of lines at once, see StopwordFilter.mask.
+    - The result is written to a temporary file that replaces `output_file` once complete.
+
+    Returns:
+        The number of lines written, without the header.
+    """
+
+    temp_file = f"{output_file}.tmp"
+
+    with open(input_file, 'r', newline='', encoding='utf-8') as input_csv, \
+            open(temp_file, 'w', newline='', encoding='utf-8') as output_csv:
+        reader = csv.reader(input_csv, delimiter=',')
+        writer = csv.writer(output_csv, delimiter=',')
+
+        header = next(reader, None)
+        if header is not None:
+            writer.writerow([header[i] for i in columns if i < len(header)])
+
+        row_count = 0
+        seen_words = set()
+        while True:
+            rows = list(itertools.islice(reader, chunk_rows))
+            if not rows:
+                break
+
+            # Mask the words to eliminate over the whole chunk at once
+            words = [row[0] for row in rows]
+            if isinstance(words_to_eliminate, stopwordFilter.StopwordFilter):
+                eliminated = words_to_eliminate.mask(words)
+            else:
+                eliminated = [word in words_to_eliminate for word in words]
+
+            for row, word, is_eliminated in zip(rows, words, eliminated):
+                # Keep the first line of every word
+                if is_eliminated or word in seen_words:
+                    continue
+                seen_words.add(word)
+                writer.writerow([row[i] for i in columns if i < len(row)])
+                row_count += 1
+
+    os.replace(temp_file, output_file)
+    return row_count
+
+
+def clean_file_with_profile(input_file, output_file, profile, eliminate=True, include_categories=None,
+                            exclude_categories=None):
+    # Runs in the worker processes of clean_directory, where the stopword filter is built once per process
+    words_to_eliminate = profile.stopword_filter(include_categories, exclude_categories) if eliminate else frozenset()
+    return clean_file(input_file, output_file, words_to_eliminate, columns=profile.columns)
+
+
+def clean_directory(input_dir, profile, output_pattern=None, eliminate=True, include_categories=None,
+                    exclude_categories=None, workers=None):
+    """
+    Cleans every frequency CSV below `input_dir` with `profile`, see clean_file.
+
+    Args:
+        input_dir: Directory of the CSV files of one language.
+        profile: CleaningProfile of the language, e.g. PROFILES['latin'].
+        output_pattern: Suffix such as '- cleaned.csv' that replaces '.csv' in the name of the cleaned copies.
+                        None cleans the files in place.
+        eliminate: Drop the words of the profile's stopword file; False only deduplicates and projects.
+        include_categories: Only eliminate the words of these categories, as a tuple.
+        exclude_categories: Never eliminate the words of these categories, as a tuple.
+        workers: Number of processes cleaning files in parallel. None uses one per CPU, 1 cleans the files one
+                 after the other in the current process.
+
+    Returns:
+        A dict with the number of files cleaned and of rows written.
+    """
+
+    words_file_name = os.path.basename(profile.words_file)
+    input_files, output_files = [], []
+    for root, dirs, files in os.walk(input_dir):
+        for file_name in files:
+            if file_name in ('greek - wordsToEliminate.csv', words_file_name):
+                continue
+
+            if file_name.endswith('.csv') and not file_name.endswith(CLEANED_SUFFIXES):
+                input_files.append(os.path.join(root, file_name))
+                output_name = file_name.replace('.csv', f' {output_pattern}') if output_pattern else file_name
+                output_files.append(os.path.join(root, output_name))
 
-    # Replace the input file with the temporary file
-    shutil.move(output_file, input_file)
+    count = len(input_files)
+    options = ([profile] * count, [eliminate] * count, [include_categories] * count, [exclude_categories] * count)
 
-    print(f"Lines with duplicate words deleted from the file: {input_file}")
+    row_count = 0
+    if workers == 1:
+        for input_file, output_file, *arguments in zip(input_files, output_files, *options):
+            row_count += clean_file_with_profile(input_file, output_file, *arguments)
+            print(f'{os.path.basename(input_file)} cleaned and saved as {output_file}')
+    elif input_files:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            row_counts = executor.map(clean_file_with_profile, input_files, output_files, *options)
+            for input_file, output_file, rows in zip(input_files, output_files, row_counts):
+                row_count += rows
+                print(f'{os.path.basename(input_file)} cleaned and saved as {output_file}')
 
+    return {'files': count, 'rows': row_count}
 
-def eliminate_words(input_dir, words_file):
-    # Read the words to eliminate from the file
-    with open(words_file, 'r', encoding='utf-8') as words_csv:
-        words_reader = csv.reader(words_csv, delimiter=',')
-        next(words_reader)  # Skip the header row
-        words_to_eliminate = set([row[0] for row in words_reader])
 
-    # Recursively iterate over the directory and process CSV files
-    for root, dirs, files in os.walk(input_dir):
-        for file_name in files:
-            if file_name == 'greek - wordsToEliminate.csv':
-                continue
+def eliminate_words(input_dir, words_file, include_categories=None, exclude_categories=None,
+                    normalizer=stopwordFilter.normalize_beta_code, workers=None):
+    """
+    Writes a "- cleaned.csv" copy of every frequency CSV below `input_dir`, without the words of `words_file`.
 
-            if file_name.endswith('.csv') and not file_name.endswith('- cleaned.csv'):
-                input_file = os.path.join(root, file_name)
-                output_file = os.path.join(root, file_name.replace('.csv', ' - cleaned.csv'))
+    The words are matched by canonical key (see stopwordFilter.normalize_beta_code), so the grave and acute, case
+    and Unicode variants of a listed word are eliminated too. `include_categories` and `exclude_categories` select the words
+    to eliminate by their "Type" column, e.g. exclude_categories=("preposition",) keeps the prepositions.
+    """
 
-                with open(input_file, 'r', encoding='utf-8') as input_csv, \
-                        open(output_file, 'w', newline='', encoding='utf-8') as output_csv:
-                    reader = csv.reader(input_csv, delimiter=',')
-                    writer = csv.writer(output_csv, delimiter=',')
-                    for row in reader:
-                        if row[0] not in words_to_eliminate:
-                            writer.writerow(row)
-                delete_lines_with_duplicate_word(output_file)
-                remove_columns(output_file)
-
-                print(f'{file_name} cleaned and saved as {output_file}')
+    profile = CleaningProfile(words_file, normalizer)
+    return clean_directory(input_dir, profile, '- cleaned.csv', True,
+                           tuple(include_categories) if include_categories is not None else None,
+                           tuple(exclude_categories) if exclude_categories is not None else None,
+                           workers)
 
 
 def eliminate_cleaned_files(directory):
@@ -87,29 +193,7 @@ def delete_non_cleaned_files(folder):
                 print(f'Deleted: {file_path}')
 
 
-def remove_columns(csv_file):
-    # Read the CSV file
-    with open(csv_file, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.reader(file)
-        # Create new rows with desired columns
-        rows = [row[:2] + row[4:5] for row in reader]
-
-    # Write the modified rows back to the CSV file
-    with open(csv_file, 'w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerows(rows)
-
-    print(f'Columns removed successfully from "{csv_file}".')
-
-def clean_columns_but_keep_all_data(input_dir):
-
-    # Recursively iterate over the directory and process CSV files
-    for root, dirs, files in os.walk(input_dir):
-        for file_name in files:
-
-            if file_name.endswith('.csv') and not file_name.endswith('- cleaned.csv'):
-                input_file = os.path.join(root, file_name)
-                delete_lines_with_duplicate_word(input_file)
-                remove_columns(input_file)
-
-                print(f'{file_name} cleaned and saved as {input_file}')
+def clean_columns_but_keep_all_data(input_dir, output_pattern=None, profile=PROFILES['greek'], workers=None):
+    # The files are cleaned in place unless an output pattern, such as '- pure.csv', is given. Only the columns of
+    # the profile are kept: no word is eliminated
+    return clean_directory(input_dir, profile, output_pattern, eliminate=False, workers=workers)
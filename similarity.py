@@ -0,0 +1,233 @@
+import numpy as np
+from scipy import sparse
+
+
+def normalize_columns(matrix):
+    """
+    Scales every column of `matrix` to unit Euclidean norm. Columns that are entirely zero are left at zero.
+
+    Args:
+        matrix: 2-D NumPy array or scipy.sparse matrix with one column per work.
+
+    Returns:
+        A float64 matrix of the same kind (dense or sparse, in CSC form) with normalized columns.
+    """
+
+    if sparse.issparse(matrix):
+        matrix = sparse.csc_matrix(matrix, dtype=np.float64)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    else:
+        matrix = np.asarray(matrix, dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=0)
+
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms != 0)
+
+    if sparse.issparse(matrix):
+        return sparse.csc_matrix(matrix @ sparse.diags(scale))
+    return matrix * scale
+
+
+def cosine_similarity_matrix(matrix, block_size=None):
+    """
+    Computes the cosine similarity between every pair of columns of `matrix`.
+
+    The columns are normalized once and the whole N x N result is a single matrix product, instead of one
+    dot product and two norms per pair.
+
+    Args:
+        matrix: 2-D NumPy array or scipy.sparse matrix with one column per work.
+        block_size: When given, the product is computed this many result columns at a time, which bounds the
+                    temporary memory used on top of the N x N output. It must be at least 1.
+
+    Returns:
+        A dense N x N float64 array. Pairs involving an all-zero column have similarity 0, as in
+        csvAnalysis.cosine_similarity.
+    """
+
+    normalized = normalize_columns(matrix)
+    n_works = normalized.shape[1]
+
+    if block_size is None:
+        # A single block, which still needs a size of 1 when there is no work
+        block_size = max(n_works, 1)
+    elif block_size < 1:
+        raise ValueError(f"block_size must be at least 1, got {block_size}")
+
+    result = np.zeros((n_works, n_works))
+    for start in range(0, n_works, block_size):
+        stop = min(start + block_size, n_works)
+        block = normalized.T @ normalized[:, start:stop]
+        result[:, start:stop] = block.toarray() if sparse.issparse(block) else block
+
+    return result
+
+
+def top_k_similar(matrix, query, k=20, include_self=False):
+    """
+    Finds the k columns of `matrix` most similar to the column `query`, without building the N x N matrix.
+
+    Args:
+        matrix: 2-D NumPy array or scipy.sparse matrix with one column per work.
+        query: Index of the query column.
+        k: Number of neighbours to return.
+        include_self: Whether the query column may appear in its own result.
+
+    Returns:
+        A list of (column index, similarity) tuples sorted from most to least similar.
+    """
+
+    normalized = normalize_columns(matrix)
+    scores = normalized.T @ normalized[:, [query]]
+    scores = np.asarray(scores.toarray() if sparse.issparse(scores) else scores).ravel()
+
+    if not include_self:
+        scores[query] = -np.inf
+
+    k = min(k, len(scores) - (0 if include_self else 1))
+    if k <= 0:
+        return []
+
+    # Select the k best in linear time, then sort only those
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [(int(index), float(scores[index])) for index in best]
+
+
+def cosine_similarity_from_blocks(blocks, n_works):
+    """
+    Computes the same matrix as cosine_similarity_matrix from an iterable of row blocks of the data.
+
+    The Gram matrix X^T X is accumulated one block of rows at a time and normalized at the end, so only one block
+    of the data is in memory at any time, on top of the N x N result.
+
+    Args:
+        blocks: Iterable of 2-D arrays with n_works columns, which stacked vertically form the data.
+        n_works: Number of columns.
+    """
+
+    gram = np.zeros((n_works, n_works))
+    for block in blocks:
+        block = np.asarray(block, dtype=np.float64)
+        gram += block.T @ block
+
+    norms = np.sqrt(np.diag(gram))
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms != 0)
+    return gram * scale[:, None] * scale[None, :]
+
+
+class RandomProjectionIndex:
+    """
+    Approximate nearest-neighbour index over the columns of a matrix for cosine similarity, by random-projection
+    locality-sensitive hashing.
+
+    Every column is hashed, in each of `n_tables` tables, by the signs of its projections on `n_bits` random
+    hyperplanes: two columns land in the same bucket with a probability that falls with the angle between them. A
+    query gathers the columns sharing its bucket in any table, and with probes=1 also those of the buckets one bit
+    away, and ranks only these candidates by their exact cosine similarity. Nothing of size N x N is ever built,
+    and a query costs about the number of candidates instead of N.
+
+    On the synthetic corpora of benchmarks.benchNearestWorks the defaults find about 92% of the exact 20 nearest
+    works, 13 times faster than the exact search at 5000 works and 37 times faster at 20000; probes=1 raises the
+    recall to about 96% for a quarter of that speed-up.
+
+    Usage:
+        index = RandomProjectionIndex(percentages)
+        neighbours = index.query(column, k=20)
+    """
+
+    def __init__(self, matrix, n_tables=8, n_bits=None, probes=0, seed=0):
+        """
+        Args:
+            matrix: 2-D NumPy array or scipy.sparse matrix with one column per work.
+            n_tables: Number of hash tables. More tables find more of the true neighbours, at the cost of more
+                      candidates per query.
+            n_bits: Hyperplanes per table. None picks about log2(N) - 3, so that buckets hold around 8 columns.
+            probes: 1 to also look up the buckets whose code differs from the query's by one bit, 0 not to.
+            seed: Seed of the random hyperplanes; the same arguments always build the same index.
+        """
+
+        normalized = normalize_columns(matrix)
+        n_rows, n_columns = normalized.shape
+        # One row per column, so that the candidates of a query are a cheap row selection
+        self.vectors = normalized.T.tocsr() if sparse.issparse(normalized) else np.ascontiguousarray(normalized.T)
+        self.n_bits = n_bits or int(min(24, max(4, np.ceil(np.log2(max(n_columns, 2))) - 3)))
+        self.probes = probes
+        self.weights = (1 << np.arange(self.n_bits)).astype(np.int64)
+
+        rng = np.random.default_rng(seed)
+        self.planes = []
+        self.codes = []
+        self.orders = []
+        self.sorted_codes = []
+        for _ in range(n_tables):
+            planes = rng.standard_normal((n_rows, self.n_bits)).astype(np.float32)
+            codes = self.hash(self.vectors @ planes)
+            order = np.argsort(codes, kind="stable")
+            self.planes.append(planes)
+            self.codes.append(codes)
+            self.orders.append(order)
+            self.sorted_codes.append(codes[order])
+
+    @property
+    def shape(self):
+        return self.vectors.shape[::-1]
+
+    def hash(self, projections):
+        # One integer code per row of projections, bit b set when the projection on hyperplane b is positive
+        return (np.asarray(projections) > 0) @ self.weights
+
+    def bucket_codes(self, code):
+        if not self.probes:
+            return [code]
+        return [code] + [code ^ (1 << bit) for bit in range(self.n_bits)]
+
+    def candidates(self, codes):
+        # Columns sharing a probed bucket with the query in at least one table
+        members = []
+        for table, code in enumerate(codes):
+            sorted_codes = self.sorted_codes[table]
+            for probe in self.bucket_codes(int(code)):
+                start = np.searchsorted(sorted_codes, probe, side="left")
+                stop = np.searchsorted(sorted_codes, probe, side="right")
+                members.append(self.orders[table][start:stop])
+        return np.unique(np.concatenate(members))
+
+    def rank(self, candidates, query_vector, k, exclude=None):
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        # Too few candidates: rank every column, so that k results are always returned
+        if len(candidates) < k:
+            candidates = np.arange(self.shape[1])
+            if exclude is not None:
+                candidates = candidates[candidates != exclude]
+
+        scores = np.asarray(self.vectors[candidates] @ query_vector).ravel()
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(candidates[index]), float(scores[index])) for index in best]
+
+    def query(self, column, k=20, include_self=False):
+        """
+        Returns the approximate k columns most similar to the column `column`, like top_k_similar: a list of
+        (column index, similarity) tuples sorted from most to least similar. The similarities are exact.
+        """
+
+        codes = [codes[column] for codes in self.codes]
+        query_vector = self.vectors[column].toarray().ravel() if sparse.issparse(self.vectors) else self.vectors[column]
+        return self.rank(self.candidates(codes), query_vector, k, None if include_self else column)
+
+    def query_vector(self, vector, k=20):
+        """
+        Returns the approximate k columns most similar to `vector`, a 1-D array with one value per row, e.g. the
+        frequencies of a work that is not in the index.
+        """
+
+        vector = np.asarray(vector, dtype=np.float64).ravel()
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        codes = [self.hash((vector @ planes)[None, :])[0] for planes in self.planes]
+        return self.rank(self.candidates(codes), vector, k)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import similarity
+
+# Factor by which the side of the matrix file grows when it is full; the file grows by its square
+GROWTH = 1.25
+
+# Share of stale works above which update starts from an empty store rather than removing them one by one
+RESET_SHARE = 0.5
+
+
+class SimilarityStore:
+    """
+    Cosine similarity matrix of a set of works, kept on disk and memory-mapped so that it can be updated in place.
+
+    The similarity of two works depends only on their two weighted vectors, so when works are added, removed or
+    changed, only the rows and columns of those works are recomputed: O(N) similarities per work instead of N x N.
+    Every work is identified by a fingerprint of its weighted vector, which tells whether its similarities are
+    still valid; a weighting that depends on the other works, like "tfidf", changes every fingerprint and so
+    recomputes the whole matrix.
+
+    The values are stored row-major as raw float64 in `path`, with room for `capacity` works, and the works, their
+    slot in the matrix and their fingerprints in `path` + ".json". Removed works free their slot by moving the last
+    work into it, and the file is only rewritten when it has to grow, by GROWTH in each dimension. When most works
+    are stale the store is reset instead, since their similarities are all computed again anyway.
+
+    Usage:
+        store = SimilarityStore(path)
+        store.update(percent_matrix)
+        values = store.similarities(percent_matrix.works)
+
+    Attributes:
+        path: Path of the raw values file.
+        works: List with the work of each slot.
+        fingerprints: List with the fingerprint of the vector of each slot.
+        values: numpy.memmap of shape (capacity, capacity); only the first len(works) rows and columns are used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.works = []
+        self.fingerprints = []
+        self.capacity = 0
+        self.values = np.zeros((0, 0))
+
+        description = None
+        if os.path.isfile(path) and os.path.isfile(path + '.json'):
+            with open(path + '.json', 'r', encoding='utf-8') as file:
+                description = json.load(file)
+
+        # An update interrupted half way leaves the store marked as dirty, and it is then rebuilt
+        if description and not description.get('dirty') and description['capacity']:
+            self.works = description['works']
+            self.fingerprints = description['fingerprints']
+            self.capacity = description['capacity']
+            self.values = np.memmap(path, dtype=np.float64, mode='r+', shape=(self.capacity, self.capacity))
+
+    def __len__(self):
+        return len(self.works)
+
+    def update(self, matrix):
+        """
+        Brings the store up to date with the weighted vectors of `matrix`.
+
+        Args:
+            matrix: frequencyMatrix.FrequencyMatrix of the weighted counts, e.g. the one returned by
+                    csvAnalysis.calculate_percentages_from_matrix.
+
+        Returns:
+            A dict with the number of works whose similarities were reused, computed and removed.
+        """
+
+        fingerprints = column_fingerprints(matrix)
+        wanted = dict(zip(matrix.works, fingerprints))
+
+        # Works that are gone or whose vector changed give up their slot
+        stale = [work for work, fingerprint in zip(self.works, self.fingerprints) if wanted.get(work) != fingerprint]
+        reused = len(self.works) - len(stale)
+
+        self.write_description(dirty=True)
+        if len(stale) > RESET_SHARE * len(self.works):
+            # The file is resized to the works of `matrix` by the next reserve
+            self.works, self.fingerprints, self.capacity = [], [], 0
+            reused = 0
+        else:
+            slots = {work: i for i, work in enumerate(self.works)}
+            for work in stale:
+                slot = slots.pop(work)
+                self.remove_slot(slot)
+                if slot < len(self.works):
+                    slots[self.works[slot]] = slot
+
+        # New and changed works take the slots after the reused ones
+        present = set(self.works)
+        added = [work for work in matrix.works if work not in present]
+        self.reserve(len(self.works) + len(added))
+        first = len(self.works)
+        self.works += added
+        self.fingerprints += [wanted[work] for work in added]
+
+        if added:
+            # One product gives the similarities of the new works with all the works, themselves included
+            normalized = similarity.normalize_columns(matrix.counts)
+            positions = {work: i for i, work in enumerate(matrix.works)}
+            columns = [positions[work] for work in self.works]
+            block = normalized.T @ normalized[:, columns[first:]]
+            block = np.asarray(block.toarray() if sparse.issparse(block) else block)[columns]
+
+            n = len(self.works)
+            self.values[:n, first:n] = block
+            self.values[first:n, :n] = block.T
+
+        if isinstance(self.values, np.memmap):
+            self.values.flush()
+        self.write_description(dirty=False)
+
+        removed = sum(1 for work in stale if work not in wanted)
+        print(f"Similarity matrix: {reused} works reused, {len(added)} computed, {removed} removed.")
+        return {'reused': reused, 'computed': len(added), 'removed': removed}
+
+    def similarities(self, works):
+        """
+        Returns the dense similarity matrix of `works`, in that order.
+        """
+
+        slots = {work: i for i, work in enumerate(self.works)}
+        order = np.array([slots[work] for work in works], dtype=np.int64)
+        return np.asarray(self.values[np.ix_(order, order)])
+
+    def remove_slot(self, slot):
+        # Move the last work into the freed slot, so that the used slots stay contiguous
+        last = len(self.works) - 1
+        if slot != last:
+            self.values[slot, :last + 1] = self.values[last, :last + 1]
+            self.values[:last + 1, slot] = self.values[:last + 1, last]
+            self.works[slot] = self.works[last]
+            self.fingerprints[slot] = self.fingerprints[last]
+        self.works.pop()
+        self.fingerprints.pop()
+
+    def reserve(self, size):
+        # Grow the file beyond the needed size, so that adding works one at a time rarely rewrites it
+        if size <= self.capacity:
+            return
+
+        capacity = max(int(np.ceil(GROWTH * size)), 16)
+        temp_path = self.path + '.tmp'
+        values = np.memmap(temp_path, dtype=np.float64, mode='w+', shape=(capacity, capacity))
+        n = len(self.works)
+        values[:n, :n] = self.values[:n, :n]
+        values.flush()
+        del values, self.values
+
+        os.replace(temp_path, self.path)
+        self.capacity = capacity
+        self.values = np.memmap(self.path, dtype=np.float64, mode='r+', shape=(capacity, capacity))
+
+    def write_description(self, dirty):
+        temp_file = self.path + '.json.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump({'capacity': self.capacity, 'dirty': dirty, 'works': self.works,
+                       'fingerprints': self.fingerprints}, file, ensure_ascii=False)
+        os.replace(temp_file, self.path + '.json')
+
+
+def column_fingerprints(matrix):
+    """
+    Returns a fingerprint of the vector of every work of `matrix`: a digest of its lemmas and values, which does not
+    depend on the position of the lemmas, so that lemmas added by other works do not change it.
+    """
+
+    # One integer key per lemma: its id in the lemma index, or a hash of its headword and short definition
+    if matrix.lemma_ids is not None:
+        keys = np.asarray(matrix.lemma_ids, dtype=np.int64).view(np.uint64)
+    else:
+        keys = pd.util.hash_pandas_object(matrix.lemmas, index=False).to_numpy()
+
+    # A copy, as the counts may be memory-mapped read-only
+    counts = sparse.csc_matrix(matrix.counts, copy=True)
+    counts.sum_duplicates()
+    fingerprints = []
+    for column in range(counts.shape[1]):
+        start, stop = counts.indptr[column], counts.indptr[column + 1]
+        rows, values = counts.indices[start:stop], counts.data[start:stop]
+        present = values != 0
+        column_keys, values = keys[rows[present]], np.asarray(values[present], dtype=np.float64)
+        order = np.argsort(column_keys, kind='stable')
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(column_keys[order].tobytes())
+        digest.update(values[order].tobytes())
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """
+    Returns the BLAKE2b hex digest of the content of `path`.
+    """
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_files(directory, suffix=''):
+    """
+    Returns the sorted paths of the files below `directory` whose name ends with `suffix`, or with one of them when
+    `suffix` is a tuple.
+    """
+
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith(suffix):
+                paths.append(os.path.join(root, file))
+    return sorted(paths)
+
+
+class StageManifest:
+    """
+    Records, for every pipeline stage that has run, the content hashes of its inputs and outputs and the
+    parameters it was run with, so that a rerun can skip the stages whose record still matches.
+
+    The manifest is a JSON file. Content hashes are cached by file size and modification time, so an
+    unchanged file is only hashed once.
+
+    Usage:
+        manifest = StageManifest("stage manifest.json")
+        manifest.run("convert", inputs, outputs, lambda: convert(...), params={...})
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stages = {}
+        self.hashes = {}
+
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                content = json.load(file)
+            self.stages = content.get('stages', {})
+            self.hashes = content.get('hashes', {})
+
+    def save(self):
+        temp_file = f'{self.path}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump({'stages': self.stages, 'hashes': self.hashes}, file, indent=1, ensure_ascii=False)
+        os.replace(temp_file, self.path)
+
+    def fingerprint(self, path):
+        """
+        Returns the content hash of `path`, or None if it does not exist.
+        """
+
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        key = os.path.normpath(path)
+        cached = self.hashes.get(key)
+        if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime_ns:
+            return cached['hash']
+
+        digest = hash_file(path)
+        self.hashes[key] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest}
+        return digest
+
+    def fingerprints(self, paths):
+        return {os.path.normpath(path): self.fingerprint(path) for path in paths}
+
+    def is_fresh(self, stage, inputs, outputs, params=None):
+        """
+        Tells whether `stage` last ran on exactly these inputs and parameters and its outputs are untouched.
+        """
+
+        record = self.stages.get(stage)
+        if record is None or record['params'] != (params or {}):
+            return False
+        if record['inputs'] != self.fingerprints(inputs):
+            return False
+
+        current_outputs = self.fingerprints(outputs)
+        return None not in current_outputs.values() and record['outputs'] == current_outputs
+
+    def record(self, stage, inputs, outputs, params=None, save=True):
+        """
+        Stores the current fingerprints of `inputs` and `outputs` for `stage`.
+
+        Pass save=False when recording many small stages in a row and call save() once at the end.
+        """
+
+        self.stages[stage] = {
+            'params': params or {},
+            'inputs': self.fingerprints(inputs),
+            'outputs': self.fingerprints(outputs),
+        }
+        if save:
+            self.save()
+
+    def run(self, stage, inputs, outputs, function, params=None, force=False):
+        """
+        Calls `function` unless `stage` is fresh, then records the stage.
+
+        Args:
+            stage: Unique name of the stage.
+            inputs: Paths of the files the stage reads.
+            outputs: Paths of the files the stage writes, or a callable returning them once the stage has run.
+            function: Callable without arguments that runs the stage.
+            params: JSON-serialisable dict of the parameters that affect the result.
+            force: Run the stage even if it is fresh.
+
+        Returns:
+            True if the stage ran, False if it was skipped.
+        """
+
+        expected_outputs = outputs() if callable(outputs) else outputs
+        if not force and expected_outputs and self.is_fresh(stage, inputs, expected_outputs, params):
+            print(f'Skipped stage: {stage} (up to date)')
+            return False
+
+        function()
+        self.record(stage, inputs, outputs() if callable(outputs) else outputs, params)
+        return True
@@ -0,0 +1,158 @@
+import functools
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Unicode Greek letters and the Beta code letters they are written with
+GREEK_TO_BETA_CODE = str.maketrans({
+    'α': 'a', 'β': 'b', 'γ': 'g', 'δ': 'd', 'ε': 'e', 'ζ': 'z', 'η': 'h', 'θ': 'q', 'ι': 'i', 'κ': 'k', 'λ': 'l',
+    'μ': 'm', 'ν': 'n', 'ξ': 'c', 'ο': 'o', 'π': 'p', 'ρ': 'r', 'σ': 's', 'ς': 's', 'τ': 't', 'υ': 'u', 'φ': 'f',
+    'χ': 'x', 'ψ': 'y', 'ω': 'w', 'ϝ': 'v',
+    # Combining diacritics, as left by the canonical decomposition
+    '\u0313': ')', '\u0314': '(', '\u0301': '/', '\u0300': '\\', '\u0342': '=', '\u0308': '+', '\u0345': '|',
+})
+
+# Beta code marks that do not distinguish words for the purpose of a stopword list: the capital marker and homograph
+# numbers, which also write the sigma variants (s1, s2, s3)
+MARKERS_PATTERN = re.compile(r'[*0-9]')
+# Accents and diaeresis, which do distinguish words ('ei)mi/' and 'ei)=mi'), and are only removed on request
+ACCENTS_PATTERN = re.compile(r'[/\\=+]')
+BREATHINGS_PATTERN = re.compile(r'[()|]')
+SPACES_PATTERN = re.compile(r'\s+')
+
+GREEK_PATTERN = re.compile('[\u0370-\u03ff\u1f00-\u1fff]')
+
+# A Beta code capital: the marker, the diacritics written before the letter, the letter
+CAPITAL_PATTERN = re.compile(r'\*([()/\\=+|]*)([a-z])')
+
+
+def to_beta_code(word):
+    """
+    Transliterates Unicode Greek into lower case Beta code; Beta code input is returned unchanged.
+    """
+
+    if not GREEK_PATTERN.search(word):
+        return word
+    return unicodedata.normalize('NFD', word).lower().translate(GREEK_TO_BETA_CODE)
+
+
+def normalize_beta_code(word, keep_breathings=True, keep_accents=True):
+    """
+    Returns the canonical key of a Beta code or Unicode Greek word.
+
+    The key is lower case, without capital markers or homograph numbers, with a grave accent written as the acute it
+    stands for before another word, and with the diacritics of every letter in a fixed order: 'E)GW\\', 'e)gw/' and
+    'ἐγώ' all give 'e)gw/'. The circumflex stays distinct from the acute, so 'ei)mi/' and 'ei)=mi' keep their keys.
+
+    Args:
+        word: The word to normalize.
+        keep_breathings: Keep the breathings and the iota subscript, which do distinguish words such as
+                         'h(' (article) and 'h)' (interjection). With False they are removed too.
+        keep_accents: Keep the accents and the diaeresis. With False they are all removed, which also matches the
+                      words that differ only by their accent.
+    """
+
+    key = to_beta_code(SPACES_PATTERN.sub('', word)).lower()
+    # Diacritics go after the letter, as they do for lower case letters
+    key = CAPITAL_PATTERN.sub(r'\2\1', key)
+    key = MARKERS_PATTERN.sub('', key)
+    key = ACCENTS_PATTERN.sub('', key) if not keep_accents else key.replace('\\', '/')
+    if not keep_breathings:
+        key = BREATHINGS_PATTERN.sub('', key)
+
+    # Sort the marks that follow each letter, so that their order in the source does not matter
+    return re.sub(r'[()/=+|]{2,}', lambda match: ''.join(sorted(match.group())), key)
+
+
+def normalize_latin(word):
+    """
+    Returns the canonical key of a Latin word: lower case, without macrons or other diacritics, homograph numbers
+    or punctuation, and with j written i and v written u, so that 'Iam', 'jam' and 'iām' all give 'iam'.
+    """
+
+    key = unicodedata.normalize('NFD', word).lower()
+    key = ''.join(character for character in key if 'a' <= character <= 'z')
+    return key.replace('j', 'i').replace('v', 'u')
+
+
+def normalize_category(category):
+    # "pronoun\" and " Pronoun" are the same category as "pronoun"
+    return re.sub(r'[^a-z ]', '', str(category).lower()).strip()
+
+
+class StopwordFilter:
+    """
+    Matches headwords against a stopword list by canonical key, see normalize_beta_code and normalize_latin.
+
+    The list is a CSV file whose first column holds the words, in any form the normalizer accepts, and whose optional
+    "Type" column holds their category (pronoun, article, conjunction...). The keys are computed once, when the
+    filter is built, and the headwords of a whole column are matched at once by mask().
+
+    Usage:
+        stopword_filter = load_stopword_filter("gr - wordsToEliminate.csv", exclude_categories=("preposition",))
+        frame = frame[~stopword_filter.mask(frame["headword"])]
+
+    Attributes:
+        keys: frozenset of the canonical keys of the words to eliminate.
+        categories: Dict mapping every category of the file to the number of its words.
+        matches: Dict caching, for every headword already met, whether it is a stopword.
+    """
+
+    def __init__(self, words, categories=None, include_categories=None, exclude_categories=None,
+                 normalizer=normalize_beta_code):
+        """
+        Args:
+            words: Iterable of the words of the list.
+            categories: Iterable with the category of every word, or None when the list has no categories.
+            include_categories: Only eliminate the words of these categories. None eliminates every category.
+            exclude_categories: Never eliminate the words of these categories.
+            normalizer: Function giving the canonical key of a word, e.g. normalize_latin for Latin, or
+                        functools.partial(normalize_beta_code, keep_accents=False) for a looser Greek match.
+        """
+
+        words = list(words)
+        categories = [normalize_category(category) for category in categories] if categories is not None \
+            else [''] * len(words)
+        include = None if include_categories is None else {normalize_category(c) for c in include_categories}
+        exclude = {normalize_category(c) for c in exclude_categories or ()}
+
+        self.normalizer = normalizer
+        self.categories = pd.Series(categories, dtype=object).value_counts().to_dict()
+        self.keys = frozenset(
+            normalizer(word) for word, category in zip(words, categories)
+            if (include is None or category in include) and category not in exclude)
+        self.matches = {}
+
+    def __contains__(self, word):
+        return self.normalizer(word) in self.keys
+
+    def mask(self, headwords):
+        """
+        Returns a boolean NumPy array telling which elements of `headwords`, a Series or a list, are stopwords.
+
+        Only the headwords the filter has not met before are normalized, once each; the column is then matched as a
+        whole against the cache. Missing values are never stopwords.
+        """
+
+        # Headwords come back in every work, so each is normalized only the first time the filter meets it
+        for word in set(headwords).difference(self.matches):
+            self.matches[word] = isinstance(word, str) and self.normalizer(word) in self.keys
+
+        return np.fromiter(map(self.matches.get, headwords), dtype=bool, count=len(headwords))
+
+
+@functools.lru_cache(maxsize=None)
+def load_stopword_filter(words_file, include_categories=None, exclude_categories=None,
+                         normalizer=normalize_beta_code):
+    """
+    Builds the StopwordFilter of a words file such as "gr - wordsToEliminate.csv" or "lat - wordsToEliminate.csv".
+
+    The result is cached, so the file is read and normalized once per run however many directories are cleaned
+    with it. Categories must be given as tuples, which can be cached.
+    """
+
+    words = pd.read_csv(words_file, dtype=str, keep_default_na=False)
+    categories = words['Type'] if 'Type' in words.columns else None
+    return StopwordFilter(words.iloc[:, 0], categories, include_categories, exclude_categories, normalizer)
@@ -0,0 +1,143 @@
+import csv
+import heapq
+import itertools
+import os
+import tempfile
+
+import pandas as pd
+
+LEMMA_COLUMNS = ["headword", "shortDefinition"]
+
+
+def parse_number(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def sort_frequency_file(input_file, column, run_file):
+    """
+    Writes the frequency list `input_file` as a sorted run: one (headword, shortDefinition, column, frequency) row per
+    lemma, sorted by lemma, with the repeated lemmas of the file already summed.
+
+    Only this one file is held in memory.
+
+    Args:
+        input_file: CSV file whose first three columns are headword, shortDefinition and frequency.
+        column: Index of the output column the frequencies belong to.
+        run_file: Path of the run to write.
+
+    Returns:
+        True if every frequency of the file is an integer, as pandas would infer it.
+    """
+
+    data = pd.read_csv(input_file, dtype={"headword": str, "shortDefinition": str}).iloc[:, 0:3]
+    data.columns = LEMMA_COLUMNS + ["frequency"]
+
+    # Drop rows with an incomplete key, as pandas' groupby does
+    data = data.dropna(subset=LEMMA_COLUMNS)
+    frequencies = pd.to_numeric(data["frequency"], errors="coerce")
+    integral = pd.api.types.is_integer_dtype(frequencies)
+    data = data.assign(frequency=frequencies.fillna(0))
+
+    # Sum repeated lemmas; groupby also sorts by (headword, shortDefinition)
+    data = data.groupby(LEMMA_COLUMNS, sort=True)["frequency"].sum().reset_index()
+
+    with open(run_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        for headword, short_definition, frequency in zip(data["headword"].tolist(),
+                                                          data["shortDefinition"].tolist(),
+                                                          data["frequency"].tolist()):
+            writer.writerow([headword, short_definition, column, repr(frequency)])
+
+    return integral
+
+
+def read_run(run_file):
+    with open(run_file, "r", newline="", encoding="utf-8") as file:
+        for headword, short_definition, column, frequency in csv.reader(file):
+            yield headword, short_definition, int(column), frequency
+
+
+def merge_runs(run_files, output_file):
+    """
+    Merges sorted runs into a single sorted run, keeping one row per (lemma, column) entry.
+    """
+
+    with open(output_file, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(heapq.merge(*(read_run(run_file) for run_file in run_files),
+                                               key=lambda entry: entry[:3]))
+
+
+def stream_merge(files, output_file, drop_duplicate_headwords=False, force_float=False, fan_in=128):
+    """
+    Merges per-work frequency lists into the lemma x column table with bounded memory.
+
+    Every file is sorted once into a run on disk, the runs are merged k-way with heapq.merge and the table is
+    written one lemma at a time, so memory holds one input file during the sort and one row per open run during
+    the merge, however large the corpus is. The output is the table that csvAnalysis builds in memory:
+    lemmas sorted by (headword, shortDefinition), rows with an incomplete key dropped, repeated lemmas summed.
+
+    Args:
+        files: List of (file path, column label) pairs. Files with the same label are summed into one column;
+               the columns follow the order in which the labels first appear.
+        output_file: CSV file to write, with the headword, shortDefinition and one column per label.
+        drop_duplicate_headwords: Keep only the first row of every headword, like
+                                  FrequencyMatrix.drop_duplicate_headwords.
+        force_float: Write the frequencies as floats even when they are all integers, like pandas does for
+                     columns that were filled with NaN before being summed.
+        fan_in: Maximum number of runs open at the same time. Larger sets of runs are first merged in passes.
+
+    Returns:
+        The number of lemma rows written.
+    """
+
+    labels = list(dict.fromkeys(label for _, label in files))
+    columns = {label: i for i, label in enumerate(labels)}
+
+    with tempfile.TemporaryDirectory(prefix="merge runs ",
+                                     dir=os.path.dirname(os.path.abspath(output_file))) as run_directory:
+        # Sort every file into its own run
+        run_files = []
+        integral = True
+        for i, (file_path, label) in enumerate(files):
+            run_file = os.path.join(run_directory, f"{i}.csv")
+            integral = sort_frequency_file(file_path, columns[label], run_file) and integral
+            run_files.append(run_file)
+
+        # Merge the runs in passes until few enough are left to be open at the same time
+        merge_pass = 0
+        while len(run_files) > fan_in:
+            merged_files = []
+            for start in range(0, len(run_files), fan_in):
+                merged_file = os.path.join(run_directory, f"pass {merge_pass} - {start}.csv")
+                merge_runs(run_files[start:start + fan_in], merged_file)
+                for run_file in run_files[start:start + fan_in]:
+                    os.remove(run_file)
+                merged_files.append(merged_file)
+            run_files = merged_files
+            merge_pass += 1
+
+        convert = int if integral and not force_float else float
+        rows = 0
+        with open(output_file, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file, lineterminator=os.linesep)
+            writer.writerow(LEMMA_COLUMNS + labels)
+
+            entries = heapq.merge(*(read_run(run_file) for run_file in run_files), key=lambda entry: entry[:3])
+            previous_headword = None
+            for (headword, short_definition), lemma_entries in itertools.groupby(entries,
+                                                                                key=lambda entry: entry[:2]):
+                values = [0] * len(labels)
+                for _, _, column, frequency in lemma_entries:
+                    values[column] += parse_number(frequency)
+
+                if drop_duplicate_headwords and headword == previous_headword:
+                    continue
+                previous_headword = headword
+
+                writer.writerow([headword, short_definition] + [repr(convert(value)) for value in values])
+                rows += 1
+
+    return rows
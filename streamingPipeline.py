@@ -0,0 +1,216 @@
+import csv
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+import xmlDownloader
+import xmlStorage
+import xmlToCsv
+
+# Marks the end of a queue
+DONE = None
+
+
+def stream_works_to_csv(work_info_files, folder, download_workers=4, convert_workers=None, requests_per_second=2.0,
+                        retries=3, timeout=60, queue_size=64, base_url=xmlDownloader.BASE_URL, manifest=None,
+                        lemma_index=None, compression='auto'):
+    """
+    Downloads the vocabulary lists of the works of the work info files and converts them to CSV as one overlapping
+    pipeline.
+
+    Three stages run at the same time, connected by queues:
+    - a producer thread reads the works of the work info files and queues them;
+    - `download_workers` threads download the queued works, sharing one pooled session and rate limiter;
+    - a converter thread hands every completed XML file to a process pool (xmlToCsv.stream_xml_to_csv).
+    The first CSV files are therefore written while the other works are still being downloaded, instead of after
+    the last download. The work queue is bounded, so a slow server holds the producer back rather than memory.
+
+    The catalogue is not part of the pipeline: its page is downloaded and parsed whole before its first row is
+    known, so the work info files are written by the catalogue stage of main.run_all first.
+
+    Args:
+        work_info_files: Dict mapping every language folder ("greek", "latin") to its work info file, as written
+                         by getIDs.split_work_info_file.
+        folder: Directory where the files are saved, as folder/lang/author/author - title - Pure freq.xml.
+        download_workers: Number of downloads running at the same time.
+        convert_workers: Number of processes converting files. None uses one per CPU, 1 converts the files in the
+                         converter thread.
+        requests_per_second: Maximum number of requests started per second, None for no limit.
+        retries: Number of times a transient failure is retried before the work is given up.
+        timeout: Seconds to wait for the server before a request is considered stalled.
+        queue_size: Maximum number of works waiting for a download worker.
+        base_url: URL of the vocablist service.
+        manifest: Optional stageCache.StageManifest, as for xmlToCsv.convert_directory_xml_to_csv.
+        lemma_index: Optional lemmaIndex.LemmaIndex into which the lemmas of the converted files are interned.
+        compression: How the XML files are stored, see xmlDownloader.fetch_text_frequencies.
+
+    Returns:
+        A dict with the number of works in the work info files, of saved, skipped and failed downloads, of
+        converted files and rows, the bytes downloaded, the seconds until the first CSV file was written and the
+        elapsed time.
+
+    Note:
+    - XML files that already exist are not downloaded again, but are still converted when their CSV is missing.
+    - Every response is validated while it is written, see xmlDownloader.save_vocabulary_list, so only complete
+      vocabulary lists reach the conversion.
+    - A work that still fails after all retries is reported, skipped and listed in folder/failed works <lang>.csv,
+      see xmlDownloader.write_failed_works; the other downloads carry on. An error of a work info file or of a
+      conversion stops the pipeline and is raised once the threads have stopped.
+    """
+
+    if compression == 'auto':
+        compression = xmlStorage.get_compression()
+
+    works = queue.Queue(maxsize=queue_size)
+    downloaded = queue.Queue()
+    lock = threading.Lock()
+    errors = []
+    work_rows = []
+    jobs = []
+    failures = {lang: [] for lang in work_info_files}
+    counts = {'saved': 0, 'skipped': 0, 'converted': 0, 'rows': 0, 'bytes': 0}
+    first_csv = []
+    start = time.perf_counter()
+
+    session = xmlDownloader.create_session(download_workers)
+    rate_limiter = xmlDownloader.RateLimiter(requests_per_second)
+
+    def count(name, value=1):
+        with lock:
+            counts[name] += value
+
+    def produce():
+        try:
+            for lang, work_info_file in work_info_files.items():
+                with open(work_info_file, 'r', newline='', encoding='utf-8') as file:
+                    reader = csv.reader(file, delimiter=',')
+                    next(reader)  # Skip the header row
+                    for row in reader:
+                        if errors:
+                            return
+                        work_rows.append(row)
+                        works.put((row[:4], lang) + xmlDownloader.work_task(row, lang, folder))
+        except Exception as error:
+            errors.append(error)
+        finally:
+            for _ in range(download_workers):
+                works.put(DONE)
+
+    def download():
+        while True:
+            task = works.get()
+            if task is DONE:
+                return
+            try:
+                download_task(*task)
+            except Exception as error:
+                errors.append(error)
+
+    def download_task(info, lang, file_name, file_path, params):
+        stored_file = xmlStorage.find_stored(file_path)
+        if stored_file:
+            print(f'Skipped: {file_name} (File already exists)')
+            count('skipped')
+            file_path = stored_file
+        elif errors:
+            return
+        else:
+            file_path = xmlStorage.stored_path(file_path, compression)
+            try:
+                count('bytes', xmlDownloader.download_work(session, file_path, params, rate_limiter, retries,
+                                                           timeout, base_url, compression))
+            except (requests.RequestException, xmlDownloader.InvalidDownload) as error:
+                with lock:
+                    failures[lang].append(list(info) + [str(error)])
+                print(f'Failed: {file_name} ({error})')
+                return
+            count('saved')
+            print(f'Saved: {file_name}')
+
+        downloaded.put(file_path)
+
+    def converted(future):
+        # Called by the pool as soon as a conversion ends, in whatever order they end
+        if future.exception() is None:
+            with lock:
+                if not first_csv:
+                    first_csv.append(time.perf_counter() - start)
+
+    def convert():
+        executor = ProcessPoolExecutor(max_workers=convert_workers) if convert_workers != 1 else None
+        futures = []
+        try:
+            while True:
+                xml_file = downloaded.get()
+                if xml_file is DONE:
+                    break
+                csv_file = xmlStorage.csv_path(xml_file)
+                if not xmlToCsv.needs_conversion(xml_file, csv_file, manifest):
+                    continue
+                jobs.append((xml_file, csv_file))
+
+                if executor is None:
+                    count('rows', xmlToCsv.stream_xml_to_csv(xml_file, csv_file) or 0)
+                    if not first_csv:
+                        first_csv.append(time.perf_counter() - start)
+                else:
+                    future = executor.submit(xmlToCsv.stream_xml_to_csv, xml_file, csv_file)
+                    future.add_done_callback(converted)
+                    futures.append(future)
+
+            # result() re-raises the exception of a conversion that failed in its process
+            for future in futures:
+                count('rows', future.result() or 0)
+        except Exception as error:
+            # The producer and the download workers stop queueing new work once they see the error
+            errors.append(error)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=bool(errors))
+
+    producer = threading.Thread(target=produce, name='catalogue')
+    downloaders = [threading.Thread(target=download, name=f'download {i}') for i in range(download_workers)]
+    converter = threading.Thread(target=convert, name='convert')
+
+    with session:
+        for thread in [producer, converter] + downloaders:
+            thread.start()
+        producer.join()
+        for thread in downloaders:
+            thread.join()
+        downloaded.put(DONE)
+        converter.join()
+
+    if errors:
+        raise errors[0]
+
+    for lang in work_info_files:
+        xmlDownloader.write_failed_works(xmlDownloader.failed_works_file(folder, lang), failures[lang])
+
+    if manifest is not None:
+        for xml_file, csv_file in jobs:
+            manifest.record(f'convert {xml_file}', [xml_file], [csv_file], save=False)
+        manifest.save()
+
+    if lemma_index is not None:
+        csv_files = [csv_file for _, csv_file in jobs]
+        if len(lemma_index) == 0:
+            csv_files = [os.path.join(root, file) for lang in work_info_files
+                         for root, dirs, files in os.walk(os.path.join(folder, lang))
+                         for file in files if file.endswith('Pure freq.csv')]
+        lemma_index.intern_files(csv_file for csv_file in csv_files if os.path.isfile(csv_file))
+        lemma_index.save()
+
+    counts['converted'] = len(jobs)
+    counts['failed'] = sum(len(lang_failures) for lang_failures in failures.values())
+    elapsed = time.perf_counter() - start
+    print(f'Streamed {len(work_rows)} works: {counts["saved"]} downloaded, {counts["skipped"]} skipped, '
+          f'{counts["failed"]} failed, {counts["converted"]} converted in {elapsed:.1f} s, first CSV after '
+          f'{first_csv[0] if first_csv else elapsed:.1f} s.')
+
+    return dict(counts, works=len(work_rows), first_csv_seconds=first_csv[0] if first_csv else None,
+                seconds=elapsed)
@@ -0,0 +1,82 @@
+import numpy as np
+from scipy import sparse
+
+# Weightings of the lemma x work counts, see weight_matrix
+WEIGHTING_MODES = ("relative", "tfidf", "log")
+
+
+def column_scale(column_sums, factor=100.0):
+    """
+    Returns factor / sum for every column, with 0 for the columns whose sum is 0, so that empty works stay empty
+    instead of becoming NaN.
+    """
+
+    column_sums = np.asarray(column_sums, dtype=np.float64)
+    return np.divide(factor, column_sums, out=np.zeros_like(column_sums), where=column_sums != 0)
+
+
+def inverse_document_frequency(document_frequencies, n_works):
+    """
+    Returns ln(n_works / df) for every lemma, with 0 for the lemmas that appear in no work.
+    """
+
+    document_frequencies = np.asarray(document_frequencies, dtype=np.float64)
+    ratio = np.divide(n_works, document_frequencies, out=np.ones_like(document_frequencies),
+                      where=document_frequencies != 0)
+    return np.log(ratio)
+
+
+def weight_matrix(matrix, mode="relative", column_sums=None):
+    """
+    Weights a lemma x work count matrix in one vectorized operation.
+
+    Modes:
+    - "relative": percentage of every lemma in its work, count * 100 / column sum, as calculate_percentages.
+    - "tfidf": the relative frequency multiplied by ln(number of works / number of works containing the lemma),
+      which damps the lemmas that every work uses.
+    - "log": ln(1 + count), which damps the very frequent lemmas without looking at the other works.
+
+    Args:
+        matrix: 2-D NumPy array or scipy.sparse matrix with one column per work.
+        mode: One of WEIGHTING_MODES.
+        column_sums: Sums of the columns of the whole matrix, when `matrix` is only a block of its rows. The
+                     weights of a row depend only on that row and on these sums, so blocks can be weighted one at
+                     a time.
+
+    Returns:
+        A float64 matrix of the same kind: sparse input stays sparse, in CSC form, with no stored zeros.
+    """
+
+    if mode not in WEIGHTING_MODES:
+        raise ValueError(f"Unknown weighting mode {mode!r}, expected one of {WEIGHTING_MODES}")
+
+    is_sparse = sparse.issparse(matrix)
+    matrix = sparse.csc_matrix(matrix, dtype=np.float64) if is_sparse else np.asarray(matrix, dtype=np.float64)
+
+    if mode == "log":
+        if is_sparse:
+            # log1p(0) is 0, so only the stored values change
+            weighted = matrix.copy()
+            weighted.data = np.log1p(weighted.data)
+            weighted.eliminate_zeros()
+            return weighted
+        return np.log1p(matrix)
+
+    if column_sums is None:
+        column_sums = np.asarray(matrix.sum(axis=0)).ravel()
+    scale = column_scale(column_sums)
+
+    if mode == "tfidf":
+        document_frequencies = np.asarray((matrix != 0).sum(axis=1)).ravel()
+        idf = inverse_document_frequency(document_frequencies, matrix.shape[1])
+        if is_sparse:
+            weighted = sparse.csc_matrix(sparse.diags(idf) @ matrix @ sparse.diags(scale))
+            weighted.eliminate_zeros()
+            return weighted
+        return matrix * scale * idf[:, None]
+
+    if is_sparse:
+        weighted = sparse.csc_matrix(matrix @ sparse.diags(scale))
+        weighted.eliminate_zeros()
+        return weighted
+    return matrix * scale
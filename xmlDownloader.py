@@ -1,65 +1,319 @@
 import csv
+import random
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
 import os
 
+import xmlStorage
+
+
+BASE_URL = 'https://www.perseus.tufts.edu/hopper/vocablist'
+
+# Responses that are worth retrying: throttling and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Header of the files listing the works whose download failed, see write_failed_works
+FAILED_WORKS_HEADER = ['Language', 'Author', 'Title', 'Work ID', 'Reason']
+
+
+class InvalidDownload(ValueError):
+    """
+    Raised when a response is not a complete vocabulary list: an error page, a truncated document or a list without
+    any <frequency> element.
+    """
+
+
+class RateLimiter:
+    """
+    Spaces out calls so that at most `requests_per_second` of them start every second, across all threads.
+
+    A rate of None (or 0) disables the limit.
+    """
+
+    def __init__(self, requests_per_second=None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+
+def create_session(pool_size=4):
+    """
+    Creates a requests.Session whose connection pool keeps one keep-alive connection per worker.
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_with_retries(session, url, params, rate_limiter, retries=3, backoff=1.0, timeout=60, stream=False):
+    """
+    Issues a GET request, retrying connection errors, timeouts and RETRY_STATUS_CODES responses.
+
+    Retries wait an exponentially growing, randomly jittered delay so that the workers do not hit the
+    server again in lockstep. Other HTTP errors are raised immediately. With stream=True the body is left
+    to be read by the caller, see save_vocabulary_list.
+    """
+
+    for attempt in range(retries + 1):
+        rate_limiter.wait()
+        try:
+            response = session.get(url, params=params, timeout=timeout, stream=stream)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                response.raise_for_status()
+                return response
+            response.close()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+
+        time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def work_task(row, lang, folder):
+    """
+    Returns the (file name, file path, query parameters) of the download of one work.
+
+    Args:
+        row: Work information in the format (language, author, title, work_id), as in the work info files.
+        lang: Language of the work ("greek" or "latin"), also used as sub folder name.
+        folder: Directory where the files are saved, as folder/lang/author/author - title - Pure freq.xml.
+    """
+
+    works = row[3]
+    author = row[1]
+    title = row[2]
+
+    # Directory path for saving the XML file, created once the download is complete
+    directory = f'{folder}/{lang}/{author}'
+
+    # Construct the query parameters
+    params = {
+        'works': works,
+        'sort': 'weighted_freq',
+        'filt': '100',
+        'filt_custom': '',
+        'output': 'xml',
+        'lang': lang
+    }
+
+    # Define the file name
+    file_name = f'{author} - {title} - Pure freq.xml'
+    return file_name, os.path.join(directory, file_name), params
+
+
+def save_vocabulary_list(response, file_path, chunk_size=64 * 1024, compression=None):
+    """
+    Writes the body of a streamed response to `file_path`, validating it while it is downloaded.
+
+    With a `compression` of xmlStorage.COMPRESSION_SUFFIXES the body is compressed as it is written, and
+    `file_path` should carry the matching suffix, see xmlStorage.stored_path.
+
+    The response must not be an HTML page, must be a well-formed XML document and must hold at least one <frequency>
+    element. It is parsed incrementally as its chunks arrive, so the check costs no second pass over the file.
+
+    Returns:
+        The number of bytes downloaded.
 
-def fetch_text_frequencies(csv_file, lang, folder):
-    base_url = 'https://www.perseus.tufts.edu/hopper/vocablist'
+    Raises:
+        InvalidDownload: The response is not a complete vocabulary list. Nothing is written.
+
+    Note:
+    - The body goes to a temporary file that is renamed to `file_path` only once it is complete and valid, so an
+      interrupted or invalid download never leaves a partial file that later runs would skip.
+    - The directory of `file_path` is created only then, so failed works leave no empty folder behind.
+    """
+
+    content_type = response.headers.get('Content-Type', '')
+    if content_type and 'xml' not in content_type:
+        raise InvalidDownload(f'unexpected content type {content_type}')
+
+    # The temporary file is in the language folder, so that the rename stays on the same file system
+    directory = os.path.dirname(file_path)
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    temp_file = tempfile.NamedTemporaryFile(dir=os.path.dirname(directory), suffix='.part', delete=False)
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    parents = []
+    frequencies = 0
+    size = 0
+
+    try:
+        with temp_file, xmlStorage.compressing_writer(temp_file, compression) as writer:
+            try:
+                for chunk in response.iter_content(chunk_size):
+                    writer.write(chunk)
+                    size += len(chunk)
+                    parser.feed(chunk)
+                    for event, element in parser.read_events():
+                        if event == 'start':
+                            if not parents and element.tag.lower() == 'html':
+                                raise InvalidDownload('HTML page instead of a vocabulary list')
+                            parents.append(element)
+                            continue
+
+                        parents.pop()
+                        if element.tag == 'frequency':
+                            frequencies += 1
+                            # Keep memory flat, as xmlToCsv.iter_frequency_rows does
+                            element.clear()
+                            if parents:
+                                del parents[-1][-1]
+                parser.close()
+            except ET.ParseError as error:
+                raise InvalidDownload(f'malformed or truncated XML ({error})') from None
+
+        if frequencies == 0:
+            raise InvalidDownload('no <frequency> element')
+
+        os.makedirs(directory, exist_ok=True)
+        os.replace(temp_file.name, file_path)
+    except BaseException:
+        os.remove(temp_file.name)
+        raise
+
+    return size
+
+
+def download_work(session, file_path, params, rate_limiter, retries=3, timeout=60, base_url=BASE_URL,
+                  compression=None):
+    """
+    Downloads the vocabulary list of one work into `file_path`, see get_with_retries and save_vocabulary_list.
+
+    Returns:
+        The number of bytes downloaded.
+    """
+
+    with get_with_retries(session, base_url, params, rate_limiter, retries, timeout=timeout,
+                          stream=True) as response:
+        return save_vocabulary_list(response, file_path, compression=compression)
+
+
+def failed_works_file(folder, lang):
+    # Default list of the works of `lang` whose download failed, see write_failed_works
+    return os.path.join(folder, f'failed works {lang}.csv')
+
+
+def write_failed_works(failed_file, failures):
+    """
+    Writes the works whose download failed, as (language, author, title, work_id, reason) rows.
+
+    The file has the layout of the work info files, so it can be given back to fetch_text_frequencies to retry only
+    these works. When nothing failed, a previous file is removed.
+    """
+
+    if not failures:
+        if os.path.isfile(failed_file):
+            os.remove(failed_file)
+        return
+
+    with open(failed_file, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, delimiter=',')
+        writer.writerow(FAILED_WORKS_HEADER)
+        writer.writerows(failures)
+
+    print(f'{len(failures)} failed works listed in {failed_file}.')
+
+
+def fetch_text_frequencies(csv_file, lang, folder, workers=4, requests_per_second=2.0, retries=3, timeout=60,
+                           base_url=BASE_URL, failed_file=None, compression='auto'):
+    """
+    Downloads the vocabulary list of every work in `csv_file` as XML.
+
+    Args:
+        csv_file: Work info file as written by getIDs.split_work_info_file.
+        lang: Language of the works ("greek" or "latin"), also used as sub folder name.
+        folder: Directory where the files are saved, as folder/lang/author/author - title - Pure freq.xml.
+        workers: Number of downloads running at the same time, sharing one pooled session.
+        requests_per_second: Maximum number of requests started per second, None for no limit.
+        retries: Number of times a transient failure is retried before the work is given up.
+        timeout: Seconds to wait for the server before a request is considered stalled.
+        base_url: URL of the vocablist service.
+        failed_file: Where the works that failed are listed, see write_failed_works. By default
+                     folder/failed works <lang>.csv. Passing that file back as `csv_file` retries only these works.
+        compression: How the files are stored: 'gzip', 'zstd' or None for plain XML, see xmlStorage. 'auto' uses
+                     xmlStorage.get_compression(). xmlToCsv reads every form transparently.
+
+    Returns:
+        A dict with the number of saved, skipped and failed works, the bytes downloaded and the elapsed time.
+
+    Note:
+    - Files that already exist, compressed or not, are skipped.
+    - Every response is validated while it is written, see save_vocabulary_list; error pages, truncated documents
+      and empty lists are never saved.
+    - A work that still fails after all retries is reported and skipped, the other downloads carry on.
+    """
+
+    if compression == 'auto':
+        compression = xmlStorage.get_compression()
+
+    tasks = []
+    skipped = 0
 
     with open(csv_file, 'r', newline='', encoding='utf-8') as file:
         reader = csv.reader(file, delimiter=',')
         next(reader)  # Skip the header row
 
         for row in reader:
-            works = row[3]
-            author = row[1]
-            title = row[2]
-
-            # Create the directory path for saving the XML file
-            directory = f'{folder}/{lang}/{author}'
-            os.makedirs(directory, exist_ok=True)
-
-            # Construct the query parameters
-            params = {
-                'works': works,
-                'sort': 'weighted_freq',
-                'filt': '100',
-                'filt_custom': '',
-                'output': 'xml',
-                'lang': lang
-            }
-
-            # Define the file name
-            file_name = f'{author} - {title} - Pure freq.xml'
-            file_path = os.path.join(directory, file_name)
-
-            if os.path.isfile(file_path):
+            file_name, file_path, params = work_task(row, lang, folder)
+
+            if xmlStorage.find_stored(file_path):
                 print(f'Skipped: {file_name} (File already exists)')
+                skipped += 1
             else:
-                response = requests.get(base_url, params=params)
-                xml_data = response.text
+                tasks.append((row[:4], file_name, xmlStorage.stored_path(file_path, compression), params))
 
-                # Save the XML file
-                with open(file_path, 'w', encoding='utf-8') as xml_file:
-                    xml_file.write(xml_data)
+    session = create_session(workers)
+    rate_limiter = RateLimiter(requests_per_second)
 
-                print(f'Saved: {file_name}')
+    saved = 0
+    failures = []
+    downloaded_bytes = 0
+    start = time.perf_counter()
 
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_work, session, file_path, params, rate_limiter, retries, timeout,
+                                   base_url, compression): (row, file_name)
+                   for row, file_name, file_path, params in tasks}
+        for future in as_completed(futures):
+            row, file_name = futures[future]
+            try:
+                downloaded_bytes += future.result()
+            except (requests.RequestException, InvalidDownload) as error:
+                failures.append(list(row) + [str(error)])
+                print(f'Failed: {file_name} ({error})')
+            else:
+                saved += 1
+                print(f'Saved: {file_name}')
 
-def delete_small_xml_files(folder):
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.endswith('.xml'):
-                file_path = os.path.join(root, file)
-                if os.path.getsize(file_path) < 10 * 1024:  # Check if file size is smaller than 2 KB
-                    os.remove(file_path)
-                    print(f'Deleted: {file_path}')
+    write_failed_works(failed_file or failed_works_file(folder, lang), failures)
+    failed = len(failures)
 
+    elapsed = time.perf_counter() - start
+    rate = saved / elapsed if elapsed else 0.0
+    print(f'Downloaded {saved} works ({downloaded_bytes / 1024 ** 2:.1f} MB) in {elapsed:.1f} s, '
+          f'{rate:.2f} works/s, {skipped} skipped, {failed} failed.')
 
-def delete_empty_folders(folder):
-    for root, dirs, files in os.walk(folder, topdown=False):
-        for dir_name in dirs:
-            dir_path = os.path.join(root, dir_name)
-            if not os.listdir(dir_path):  # Check if the folder is empty
-                os.rmdir(dir_path)
-                print(f'Deleted empty folder: {dir_path}')
+    return {
+        'saved': saved,
+        'skipped': skipped,
+        'failed': failed,
+        'bytes': downloaded_bytes,
+        'seconds': elapsed,
+    }
@@ -0,0 +1,156 @@
+import gzip
+import os
+import shutil
+
+# File name suffix of every compression the vocabulary lists can be stored with, None for plain XML
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+# Suffixes of the stored vocabulary lists, plain or compressed
+XML_SUFFIXES = tuple('.xml' + suffix for suffix in COMPRESSION_SUFFIXES.values())
+
+
+def get_compression():
+    """
+    Returns the best compression available: 'zstd' when the zstandard package is installed, 'gzip' otherwise.
+    """
+
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return 'gzip'
+    return 'zstd'
+
+
+def compression_of(path):
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if compression and path.endswith(suffix):
+            return compression
+    return None
+
+
+def is_xml_file(path):
+    return path.endswith(XML_SUFFIXES)
+
+
+def stored_path(xml_file, compression):
+    """
+    Returns the path a vocabulary list named `xml_file` ("... - Pure freq.xml") is stored at with `compression`.
+    """
+
+    return xml_file + COMPRESSION_SUFFIXES[compression]
+
+
+def find_stored(xml_file):
+    """
+    Returns the path at which the vocabulary list `xml_file` is stored, compressed or not, or None when it is not.
+    """
+
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if os.path.isfile(xml_file + suffix):
+            return xml_file + suffix
+    return None
+
+
+def csv_path(xml_file):
+    """
+    Returns the CSV file a stored vocabulary list is converted to: "x - Pure freq.xml.gz" gives "x - Pure freq.csv".
+    """
+
+    for suffix in XML_SUFFIXES[::-1]:
+        if xml_file.endswith(suffix):
+            return xml_file[:-len(suffix)] + '.csv'
+    return os.path.splitext(xml_file)[0] + '.csv'
+
+
+def open_xml(path):
+    """
+    Opens a stored vocabulary list for reading as a binary stream, decompressing it on the fly when it is compressed,
+    so that a parser such as ElementTree.iterparse reads it without it ever being decompressed on disk.
+    """
+
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def compressing_writer(file, compression):
+    """
+    Wraps the binary file object `file` so that what is written to the wrapper is stored with `compression`.
+    Closing the wrapper flushes the compressed stream but leaves `file` open.
+    """
+
+    if compression == 'gzip':
+        # Level 6 compresses the repetitive XML nearly as well as 9, several times faster
+        return gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=10).stream_writer(file, closefd=False)
+    return NonClosingWriter(file)
+
+
+class NonClosingWriter:
+    """
+    Plain counterpart of the compressing writers: writes straight to `file` and does not close it.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def close(self):
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def compress_xml_files(directory, compression=None):
+    """
+    Compresses in place the plain vocabulary lists below `directory`, e.g. those downloaded by an earlier version.
+
+    Every file is written to a temporary file first and the plain file removed only once the compressed one is
+    complete.
+
+    Args:
+        directory: Root of the downloaded vocabulary lists.
+        compression: 'gzip' or 'zstd'. None uses get_compression().
+
+    Returns:
+        A dict with the number of files compressed and their total size before and after, in bytes.
+    """
+
+    compression = compression or get_compression()
+    files = 0
+    plain_bytes = 0
+    compressed_bytes = 0
+
+    for root, dirs, names in os.walk(directory):
+        for name in names:
+            if not name.endswith('.xml'):
+                continue
+            xml_file = os.path.join(root, name)
+            target = stored_path(xml_file, compression)
+            temp_file = target + '.tmp'
+
+            with open(xml_file, 'rb') as source, open(temp_file, 'wb') as file:
+                with compressing_writer(file, compression) as writer:
+                    shutil.copyfileobj(source, writer, 1024 * 1024)
+            os.replace(temp_file, target)
+
+            plain_bytes += os.path.getsize(xml_file)
+            compressed_bytes += os.path.getsize(target)
+            os.remove(xml_file)
+            files += 1
+
+    print(f'Compressed {files} vocabulary lists with {compression}: '
+          f'{plain_bytes / 1024 ** 2:.1f} MB to {compressed_bytes / 1024 ** 2:.1f} MB.')
+    return {'files': files, 'plain_bytes': plain_bytes, 'compressed_bytes': compressed_bytes}
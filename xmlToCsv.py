@@ -1,13 +1,20 @@
 import csv
 import xml.etree.ElementTree as ET
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import xmlStorage
+
+CSV_HEADER = ['headword', 'shortDefinition', 'maxFrequency', 'minFrequency', 'weightedFrequency', 'keyTermScore']
+
 
 def convert_xml_to_csv(xml_file, csv_file):
     if os.path.isfile(csv_file):
         print(f'Skipped: {csv_file} (File already exists)')
         return
 
-    tree = ET.parse(xml_file)
+    with xmlStorage.open_xml(xml_file) as file:
+        tree = ET.parse(file)
     root = tree.getroot()
 
     # Extract data from XML and prepare rows
@@ -24,18 +31,149 @@ def convert_xml_to_csv(xml_file, csv_file):
     # Write data to CSV file
     with open(csv_file, 'w', newline='', encoding='utf-8') as file:
         writer = csv.writer(file)
-        writer.writerow(['headword', 'shortDefinition', 'maxFrequency', 'minFrequency', 'weightedFrequency', 'keyTermScore'])
+        writer.writerow(CSV_HEADER)
         writer.writerows(rows)
 
     print(f'CSV file "{csv_file}" created successfully.')
 
 
-def convert_directory_xml_to_csv(directory):
+def iter_frequency_rows(xml_file):
+    """
+    Incrementally parses a vocabulary list and yields one CSV row per <frequency> element.
+
+    Every <frequency> element is dropped from the tree as soon as its row has been produced, so memory
+    stays flat however large the document is. Compressed lists (see xmlStorage) are decompressed on the fly.
+    """
+
+    with xmlStorage.open_xml(xml_file) as file:
+        parents = []
+        for event, element in ET.iterparse(file, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+
+            parents.pop()
+            if element.tag != 'frequency':
+                continue
+
+            # Collect the fields in a single walk over the children
+            values = {}
+            for child in element:
+                if child.tag == 'lemma':
+                    for field in child:
+                        values[field.tag] = field.text
+                else:
+                    values[child.tag] = child.text
+            yield [values.get(column) for column in CSV_HEADER]
+
+            # The element is the last child of its parent while its end event is handled
+            element.clear()
+            if parents:
+                del parents[-1][-1]
+
+
+def stream_xml_to_csv(xml_file, csv_file):
+    """
+    Streaming counterpart of convert_xml_to_csv: rows are written while the XML is being parsed.
+
+    Returns:
+        The number of rows written, or None when the CSV file already exists.
+
+    Note:
+    - The CSV is written to a temporary file and renamed once complete, so an interrupted conversion
+      never leaves a truncated CSV that later runs would skip.
+    """
+
+    if os.path.isfile(csv_file):
+        print(f'Skipped: {csv_file} (File already exists)')
+        return None
+
+    temp_file = f'{csv_file}.tmp'
+    count = 0
+    try:
+        with open(temp_file, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_HEADER)
+            for row in iter_frequency_rows(xml_file):
+                writer.writerow(row)
+                count += 1
+        os.replace(temp_file, csv_file)
+    except BaseException:
+        # A malformed XML file must not leave its partial CSV behind
+        os.remove(temp_file)
+        raise
+
+    print(f'CSV file "{csv_file}" created successfully.')
+    return count
+
+
+def needs_conversion(xml_file, csv_file, manifest=None):
+    """
+    Tells whether `xml_file` has to be converted into `csv_file`.
+
+    With a stageCache.StageManifest, a CSV is kept only if it was produced from the current content of its XML file
+    and has not been modified since; a stale, truncated or foreign CSV is removed, so that it is converted again.
+    Without one, every file is converted, and stream_xml_to_csv skips the CSV files that exist.
+    """
+
+    if manifest is None:
+        return True
+    if manifest.is_fresh(f'convert {xml_file}', [xml_file], [csv_file]):
+        return False
+    if os.path.isfile(csv_file):
+        os.remove(csv_file)
+    return True
+
+
+def convert_directory_xml_to_csv(directory, workers=None, manifest=None, lemma_index=None):
+    """
+    Converts every XML file below `directory`, plain or compressed, into a CSV file next to it.
+
+    Args:
+        directory: Root of the downloaded vocabulary lists.
+        workers: Number of processes converting files in parallel. None uses one per CPU, 1 converts the
+                 files one after the other in the current process.
+        manifest: Optional stageCache.StageManifest. When given, a CSV is kept only if it was produced from
+                  the current content of its XML file and has not been modified since; otherwise it is
+                  converted again.
+        lemma_index: Optional lemmaIndex.LemmaIndex into which the lemmas of the converted files are interned, so
+                     that the later stages find them with their ids. An empty index gets the lemmas of every CSV.
+
+    Returns:
+        A dict with the number of files converted and of rows written.
+    """
+
+    jobs = []
+    csv_files = []
     for root, dirs, files in os.walk(directory):
         for file in files:
-            if file.endswith('.xml'):
+            if xmlStorage.is_xml_file(file):
                 xml_file = os.path.join(root, file)
-                csv_file = os.path.splitext(xml_file)[0] + '.csv'
-                convert_xml_to_csv(xml_file, csv_file)
+                csv_file = xmlStorage.csv_path(xml_file)
+                csv_files.append(csv_file)
+                if needs_conversion(xml_file, csv_file, manifest):
+                    jobs.append((xml_file, csv_file))
+
+    rows = 0
+    if workers == 1:
+        for xml_file, csv_file in jobs:
+            rows += stream_xml_to_csv(xml_file, csv_file) or 0
+    elif jobs:
+        job_xml_files, job_csv_files = zip(*jobs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map re-raises the exception of a failed conversion when its count is read
+            for count in executor.map(stream_xml_to_csv, job_xml_files, job_csv_files):
+                rows += count or 0
+
+    if manifest is not None:
+        for xml_file, csv_file in jobs:
+            manifest.record(f'convert {xml_file}', [xml_file], [csv_file], save=False)
+        manifest.save()
+
+    if lemma_index is not None:
+        converted = csv_files if len(lemma_index) == 0 else [csv_file for _, csv_file in jobs]
+        lemma_index.intern_files(csv_file for csv_file in converted if os.path.isfile(csv_file))
+        lemma_index.save()
 
     print('Conversion completed for all XML files in the directory.')
+    return {'files': len(jobs), 'rows': rows}